@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "shop",
 ]
 
@@ -137,6 +138,32 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Фильтрация и сортировка каталога в памяти процесса (нужен NumPy)
+SHOP_MEMORY_CATALOG = os.getenv("SHOP_MEMORY_CATALOG") == "1"
+# Шина сброса кэшей процессов через LISTEN/NOTIFY (shop/invalidation.py)
+SHOP_INVALIDATION_BUS = os.getenv("SHOP_INVALIDATION_BUS") == "1"
+
+# Общий кэш всех процессов: redis://host:6379/0 (нужен пакет redis)
+# или memcached://host:11211 (нужен pymemcache). Без него у каждого
+# процесса свой LocMemCache и версии каталога в других процессах не видны
+SHOP_CACHE_URL = os.getenv("SHOP_CACHE_URL", "")
+if SHOP_CACHE_URL.startswith(("redis://", "rediss://")):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": SHOP_CACHE_URL,
+        }
+    }
+elif SHOP_CACHE_URL.startswith("memcached://"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": SHOP_CACHE_URL.removeprefix("memcached://"),
+        }
+    }
+# Кэш целых страниц (shop/pages.py); включается только вместе с общим кэшем
+SHOP_PAGE_CACHE = os.getenv("SHOP_PAGE_CACHE", "1" if SHOP_CACHE_URL else "0") == "1"
+
 
 
 try:
@@ -1,11 +1,23 @@
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.utils.html import format_html
+from .cache import bump_catalog_version
+from .invalidation import is_enabled as invalidation_bus_enabled, publish
 from .models import (
-    Category, Product, ProductImage, Review, 
+    Category, Product, ProductImage, ProductVariant, Review, 
     Contact
 )
 
 
+def variants_changed(product):
+    """Сбрасывает кэши каталога после пакетного сохранения вариантов товара"""
+    bump_catalog_version()
+    if invalidation_bus_enabled():
+        publish(product)
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug', 'is_active', 'created_at']
@@ -34,6 +46,32 @@ class ProductImageInline(admin.TabularInline):
     fields = ['image', 'alt_text', 'is_main', 'order']
 
 
+class ProductVariantForm(forms.ModelForm):
+    """Форма варианта: размер и цвет приводятся до проверки уникальности, в том числе между строками"""
+
+    def clean_size(self):
+        return ProductVariant.normalize_size(self.cleaned_data['size'])
+
+    def clean_color(self):
+        return ProductVariant.normalize_color(self.cleaned_data['color'])
+
+    def validate_unique(self):
+        # Инлайн-форма исключает товар из full_clean, и ограничение (product, size, color)
+        # иначе проверялось бы только между строками формы, но не с сохраненными вариантами
+        super().validate_unique()
+        try:
+            self.instance.validate_constraints(exclude=self._get_validation_exclusions())
+        except ValidationError as e:
+            self._update_errors(e)
+
+
+class ProductVariantInline(admin.TabularInline):
+    model = ProductVariant
+    form = ProductVariantForm
+    extra = 1
+    fields = ['sku', 'size', 'color', 'stock']
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = [
@@ -49,7 +87,7 @@ class ProductAdmin(admin.ModelAdmin):
     ]
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ['created_at', 'updated_at', 'discount_percentage', ]
-    inlines = [ProductImageInline]
+    inlines = [ProductImageInline, ProductVariantInline]
     
     fieldsets = (
         ('Основная информация', {
@@ -72,6 +110,23 @@ class ProductAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not ProductVariant:
+            return super().save_formset(request, form, formset, change)
+        
+        # Варианты сохраняются пакетно: несколько запросов вместо запроса на каждую строку
+        variants = formset.save(commit=False)
+        for variant in variants:
+            variant.normalize()
+        ProductVariant.objects.filter(pk__in=[variant.pk for variant in formset.deleted_objects]).delete()
+        ProductVariant.objects.bulk_update(
+            [variant for variant in variants if variant.pk], ['sku', 'size', 'color', 'stock']
+        )
+        ProductVariant.objects.bulk_create([variant for variant in variants if not variant.pk])
+        # Пакетные запросы не вызывают post_save: кэши каталога и шина сбрасываются здесь
+        product = form.instance
+        transaction.on_commit(lambda: variants_changed(product))
 
 
 @admin.register(Review)
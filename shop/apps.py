@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "shop"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .invalidation import is_enabled, start_listener
+        from .pages import check_page_cache
+
+        check_page_cache()
+        if is_enabled():
+            start_listener()
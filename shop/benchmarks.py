@@ -0,0 +1,124 @@
+"""Вспомогательные функции для команд-бенчмарков.
+
+Синтетический каталог создаётся внутри транзакции, которую команда
+откатывает после замеров. Пока она открыта, команды держат блокировки на
+таблицах магазина (SearchWord.rebuild() очищает словарь поиска,
+benchmark_cards переписывает описания всех товаров), поэтому без
+--allow-non-test-db они работают только с тестовой базой (test_*).
+"""
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from .models import Category, Product, SearchWord
+from .text import normalize_search_text
+
+
+ADJECTIVES = [
+    'красное', 'синее', 'черное', 'белое', 'летнее', 'зимнее', 'льняное', 'шерстяное',
+    'классическое', 'вечернее', 'oversize', 'slim', 'casual', 'basic', 'vintage', 'cotton',
+]
+NOUNS = [
+    'платье', 'рубашка', 'футболка', 'джинсы', 'брюки', 'юбка', 'куртка', 'пальто',
+    'свитер', 'кардиган', 'шорты', 'жилет', 'dress', 'shirt', 'jacket', 'hoodie',
+]
+CATEGORY_NAMES = [
+    'Платья', 'Рубашки', 'Футболки', 'Джинсы', 'Брюки', 'Юбки', 'Куртки', 'Пальто',
+    'Свитера', 'Кардиганы', 'Шорты', 'Жилеты', 'Аксессуары', 'Обувь', 'Спорт', 'Детская одежда',
+]
+
+
+class BenchmarkCommand(BaseCommand):
+    """Команда-бенчмарк: отказывается работать с нетестовой базой без --allow-non-test-db"""
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--allow-non-test-db', action='store_true',
+            help='Разрешить запуск на базе, имя которой не начинается с test_',
+        )
+        return parser
+
+    def execute(self, *args, **options):
+        name = connection.settings_dict['NAME'] or ''
+        if not name.startswith('test_') and not options.get('allow_non_test_db'):
+            raise CommandError(
+                f'База {name!r} не тестовая: бенчмарк блокирует и переписывает таблицы магазина. '
+                'Запустите на копии базы test_* или передайте --allow-non-test-db'
+            )
+        return super().execute(*args, **options)
+
+
+def create_synthetic_catalog(count, seed=42, batch_size=5000):
+    """Создаёт count товаров в синтетических категориях"""
+    rng = random.Random(seed)
+    categories = [
+        Category(name=name, slug=f'bench-category-{i}', search_name=normalize_search_text(name))
+        for i, name in enumerate(CATEGORY_NAMES)
+    ]
+    Category.objects.bulk_create(categories)
+    genders = [code for code, _ in Product.GENDER_CHOICES]
+
+    for start in range(0, count, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, count)):
+            name = f'{rng.choice(ADJECTIVES).capitalize()} {rng.choice(NOUNS)} {rng.randrange(10000)}'
+            price = Decimal(rng.randrange(500, 50000))
+            batch.append(Product(
+                name=name,
+                slug=f'bench-product-{i}',
+                search_name=normalize_search_text(name),
+                description=f'{name}. {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} на каждый день.',
+                category=rng.choice(categories),
+                gender=rng.choice(genders),
+                price=price,
+                old_price=price * Decimal('1.3') if rng.random() < 0.3 else None,
+                main_image='products/bench.jpg',
+            ))
+        Product.objects.bulk_create(batch)
+    # bulk_create не вызывает save(): словарь поиска собираем целиком
+    SearchWord.rebuild()
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE shop_category')
+        cursor.execute('ANALYZE shop_product')
+        cursor.execute('ANALYZE shop_searchword')
+    return categories
+
+
+@contextmanager
+def synthetic_catalog(count, seed=42):
+    """Синтетический каталог, который откатывается после выхода из блока"""
+    with transaction.atomic():
+        categories = create_synthetic_catalog(count, seed=seed)
+        try:
+            yield categories
+        finally:
+            transaction.set_rollback(True)
+
+
+def measure(func, repeat):
+    """Выполняет func repeat раз и возвращает задержки в миллисекундах"""
+    func()  # прогрев
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(timings):
+    """Медиана, 95-й перцентиль и максимум задержек"""
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        'p50': statistics.median(ordered),
+        'p95': p95,
+        'max': ordered[-1],
+    }
@@ -0,0 +1,245 @@
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+logger = logging.getLogger('shop.cache')
+
+CATALOG_VERSION_KEY = 'shop:catalog-version'
+CATALOG_CHANGED_KEY = 'shop:catalog-changed-at'
+# Бэкенды, у которых каждый процесс видит только свои записи
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache():
+    """Видят ли все процессы одни и те же записи кэша (и версии) по умолчанию"""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _initial_version():
+    # Если ключ версии вытеснен из кэша, новая версия не должна совпасть
+    # ни с одной из прежних, иначе оживут устаревшие записи
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    """Текущая версия по ключу; входит в ключи кэшей, которые она защищает"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Делает недействительными все записи, закэшированные под версией key"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), timeout=None)
+
+
+def get_catalog_version():
+    """Текущая версия каталога; входит в ключи всех кэшей, зависящих от товаров"""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Делает недействительными все закэшированные данные каталога"""
+    bump_version(CATALOG_VERSION_KEY)
+    cache.set(CATALOG_CHANGED_KEY, time.time(), timeout=None)
+
+
+def get_catalog_changed_at():
+    """Время последнего изменения каталога (timestamp) или None, если оно неизвестно"""
+    return cache.get(CATALOG_CHANGED_KEY)
+
+
+def reviews_version_key(product_id):
+    return f'shop:reviews-version:{product_id}'
+
+
+def images_version_key(product_id):
+    return f'shop:images-version:{product_id}'
+
+
+def stats_key(name, counter):
+    return f'shop:stats:{name}:{counter}'
+
+
+def record_stats(name, **counters):
+    """Прибавляет значения к счетчикам name (общим для всех процессов)"""
+    for counter, value in counters.items():
+        if value and not cache.add(stats_key(name, counter), value, timeout=None):
+            try:
+                cache.incr(stats_key(name, counter), value)
+            except ValueError:
+                pass
+
+
+def get_stats(name, counters):
+    """Значения счетчиков name: {счетчик: значение}"""
+    values = cache.get_many([stats_key(name, counter) for counter in counters])
+    return {counter: values.get(stats_key(name, counter), 0) for counter in counters}
+
+
+# Устаревшее значение хранится ещё столько после истечения срока и отдаётся,
+# пока одно из обращений пересчитывает его в фоне (или пока БД недоступна)
+STALE_TIMEOUT = 60 * 60 * 24
+LOCK_TIMEOUT = 30
+LOCK_WAIT_INTERVAL = 0.05
+# Чем больше, тем раньше (с учётом времени расчета) значение обновляется до истечения срока
+EARLY_EXPIRATION_BETA = 1.0
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _compute(key, compute, timeout, version):
+    started = time.perf_counter()
+    value = compute()
+    delta = time.perf_counter() - started
+    cache.set(key, (value, version, time.time() + timeout, delta), timeout + STALE_TIMEOUT)
+    return value
+
+
+def _refresh(key, compute, timeout, version):
+    try:
+        _compute(key, compute, timeout, version)
+    except Exception:
+        logger.exception('Не удалось обновить %s, отдается устаревшее значение', key)
+    finally:
+        cache.delete(_lock_key(key))
+        # Поток не из пула запросов: его соединения с БД никто больше не закроет
+        connections.close_all()
+
+
+def get_or_compute(key, compute, timeout, version=None):
+    """Значение key из кэша или результат compute() с защитой от одновременных пересчетов.
+
+    Значение устаревает по сроку timeout (вероятностно раньше, чем дольше
+    расчет) или когда version отличается от сохраненной. Устаревшее
+    значение отдается сразу, а пересчитывает его в фоне только тот, кто
+    взял блокировку ключа. Если значения нет, считает один, остальные ждут.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, entry_version, expires, delta = entry
+        early = delta * EARLY_EXPIRATION_BETA * -math.log(1 - random.random())
+        if entry_version == version and time.time() + early < expires:
+            return value
+        if cache.add(_lock_key(key), 1, LOCK_TIMEOUT):
+            threading.Thread(target=_refresh, args=(key, compute, timeout, version), daemon=True).start()
+        return value
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(_lock_key(key), 1, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            return compute()
+        time.sleep(LOCK_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    try:
+        # Значение могли посчитать, пока блокировка была занята
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        return _compute(key, compute, timeout, version)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+LOCAL_CACHE_SIZE = 128
+VERSION_CHECK_INTERVAL_MS = 1000
+LOCAL_CACHE_STATS = ('local_hits', 'shared_hits', 'misses')
+
+
+class LocalCache:
+    """LRU процесса перед общим кэшем для небольших редко меняющихся данных.
+
+    Записи обоих уровней принадлежат версии version_key. Версия читается из
+    общего кэша не чаще раза в check_interval_ms; при её смене локальный
+    уровень очищается. Счетчики попаданий по уровням копятся в процессе и
+    переносятся в общие счетчики name при проверке версии. clear() (его
+    вызывают обработчики шины сброса) не ждёт проверки версии.
+    """
+
+    def __init__(self, name, version_key, max_size=LOCAL_CACHE_SIZE, check_interval_ms=VERSION_CHECK_INTERVAL_MS):
+        self.name = name
+        self.version_key = version_key
+        self.max_size = max_size
+        self.check_interval = check_interval_ms / 1000
+        self._entries = OrderedDict()
+        self._version = None
+        self._checked_at = None
+        self._counts = dict.fromkeys(LOCAL_CACHE_STATS, 0)
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._version
+        version = get_version(self.version_key)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._checked_at = now
+            counts, self._counts = self._counts, dict.fromkeys(LOCAL_CACHE_STATS, 0)
+        record_stats(self.name, **counts)
+        return version
+
+    def _count(self, counter):
+        with self._lock:
+            self._counts[counter] += 1
+
+    def get_or_set(self, key, compute, timeout=None):
+        """Значение key из памяти процесса, из общего кэша или из compute()"""
+        version = self._check_version()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._counts['local_hits'] += 1
+                return self._entries[key]
+
+        # В общем кэше значение лежит в кортеже: так отличимо закэшированное None
+        shared_key = f'{key}:{version}'
+        entry = cache.get(shared_key)
+        if entry is None:
+            self._count('misses')
+            value = compute()
+            cache.set(shared_key, (value,), timeout)
+        else:
+            self._count('shared_hits')
+            value = entry[0]
+
+        with self._lock:
+            # Версия могла смениться, пока значение читалось
+            if version == self._version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Сбрасывает записи процесса; версия перечитывается при следующем обращении"""
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            self._checked_at = None
+        if not is_shared_cache():
+            # Общий уровень - кэш этого же процесса, и другой процесс не мог сменить в нём версию
+            bump_version(self.version_key)
@@ -0,0 +1,239 @@
+import hashlib
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+
+from .cache import get_or_compute
+from .models import Product, ProductVariant
+from .pagination import DEFAULT_SORT, SORT_ORDERS
+from .reference import active_category
+from .search import search_products
+
+
+logger = logging.getLogger('shop.catalog')
+
+PAGE_SIZES = (12, 24, 48)
+DEFAULT_PAGE_SIZE = 12
+SEARCH_MAX_LENGTH = 100
+FACET_VALUE_MAX_LENGTH = 50
+# Допустимые значения фильтра "скидка от N%"
+DISCOUNT_FILTERS = (10, 20, 30, 50)
+
+# Поля ключей сортировки, которых нет в карточке (по ним строится курсор)
+SORT_KEY_FIELDS = ('created_at', 'avg_rating')
+
+# Списки id сбрасываются сигналами; срок жизни страхует от массовых
+# изменений в обход save() (bulk_create, update)
+ID_LIST_TIMEOUT = 60 * 60
+
+
+@dataclass(frozen=True)
+class CatalogSpec:
+    """Проверенный и нормализованный набор параметров каталога.
+
+    Одинаковые по смыслу запросы дают равные спецификации, поэтому
+    ключи спецификации подходят для кэшей и метрик.
+    """
+    category: str = ''
+    categories: tuple = ()
+    gender: str = ''
+    size: str = ''
+    color: str = ''
+    in_stock: bool = False
+    min_discount: int = 0
+    search: str = ''
+    sort: str = DEFAULT_SORT
+    page_size: int = DEFAULT_PAGE_SIZE
+
+    @classmethod
+    def from_query(cls, params):
+        """Строит спецификацию из GET-параметров, отбрасывая некорректные значения"""
+        gender = params.get('gender', '')
+        if gender not in dict(Product.GENDER_CHOICES):
+            gender = ''
+
+        sort = params.get('sort', DEFAULT_SORT)
+        if sort not in SORT_ORDERS:
+            sort = DEFAULT_SORT
+
+        try:
+            page_size = int(params.get('page_size', DEFAULT_PAGE_SIZE))
+        except (TypeError, ValueError):
+            page_size = DEFAULT_PAGE_SIZE
+        if page_size not in PAGE_SIZES:
+            page_size = DEFAULT_PAGE_SIZE
+
+        try:
+            min_discount = int(params.get('discount', 0))
+        except (TypeError, ValueError):
+            min_discount = 0
+        if min_discount not in DISCOUNT_FILTERS:
+            min_discount = 0
+
+        categories = tuple(sorted({
+            int(value) for value in params.get('categories', '').split(',')
+            if value.strip().isdecimal()
+        }))
+
+        return cls(
+            category=params.get('category', '').strip(),
+            categories=categories,
+            gender=gender,
+            size=params.get('size', '').strip().upper()[:FACET_VALUE_MAX_LENGTH],
+            color=params.get('color', '').strip().lower()[:FACET_VALUE_MAX_LENGTH],
+            in_stock=params.get('in_stock') in ('1', 'on', 'true'),
+            min_discount=min_discount,
+            search=' '.join(params.get('search', '').split())[:SEARCH_MAX_LENGTH],
+            sort=sort,
+            page_size=page_size,
+        )
+
+    @property
+    def filter_key(self):
+        """Ключ набора фильтров без сортировки и размера страницы"""
+        filters = (
+            self.category, self.categories, self.gender, self.size, self.color, self.in_stock,
+            self.min_discount, self.search,
+        )
+        return hashlib.md5(repr(filters).encode()).hexdigest()
+
+    @property
+    def key(self):
+        """Ключ полной спецификации, включая сортировку и размер страницы"""
+        return f'{self.filter_key}:{self.sort}:{self.page_size}'
+
+    @property
+    def query_params(self):
+        """Параметры спецификации для ссылок пагинации (с ведущим &)"""
+        params = []
+        if self.category:
+            params.append(('category', self.category))
+        if self.categories:
+            params.append(('categories', ','.join(map(str, self.categories))))
+        if self.gender:
+            params.append(('gender', self.gender))
+        if self.size:
+            params.append(('size', self.size))
+        if self.color:
+            params.append(('color', self.color))
+        if self.in_stock:
+            params.append(('in_stock', 1))
+        if self.min_discount:
+            params.append(('discount', self.min_discount))
+        if self.search:
+            params.append(('search', self.search))
+        if self.sort != DEFAULT_SORT:
+            params.append(('sort', self.sort))
+        if self.page_size != DEFAULT_PAGE_SIZE:
+            params.append(('page_size', self.page_size))
+        return f'&{urlencode(params)}' if params else ''
+
+    @property
+    def has_id_list(self):
+        """Можно ли отдавать выдачу из закэшированного списка id (только категория, пол и сортировка)"""
+        return not (
+            self.search or self.categories or self.size or self.color or self.in_stock or self.min_discount
+        )
+
+    @property
+    def has_count_estimate(self):
+        """Осмысленна ли оценка планировщика для числа товаров (нет поиска, фильтров по массивам и EXISTS)"""
+        return not (self.search or self.size or self.color or self.in_stock)
+
+    def get_category(self):
+        """Активная категория из параметра category (404, если её нет)"""
+        if not self.category:
+            return None
+        category = active_category(self.category)
+        if category is None:
+            raise Http404('Категория не найдена')
+        return category
+
+    def queryset(self, category=None):
+        """Отфильтрованные и отсортированные товары только с полями для карточек"""
+        products = Product.objects.cards(*SORT_KEY_FIELDS)
+        if category is not None:
+            products = products.filter(category=category)
+        if self.categories:
+            products = products.filter(category_id__in=self.categories)
+        if self.gender:
+            products = products.filter(gender=self.gender)
+        # Поиск по GIN-индексам массивов (оператор @>)
+        if self.size:
+            products = products.filter(sizes__contains=[self.size])
+        if self.color:
+            products = products.filter(colors__contains=[self.color])
+        if self.in_stock:
+            # Есть вариант с остатком (в выбранном размере и цвете, если они заданы)
+            variants = ProductVariant.objects.filter(product=OuterRef('pk'), stock__gt=0)
+            if self.size:
+                variants = variants.filter(size=self.size)
+            if self.color:
+                variants = variants.filter(color=self.color)
+            products = products.filter(Exists(variants))
+        if self.min_discount:
+            products = products.filter(discount__gte=self.min_discount)
+        if self.search:
+            products = search_products(products, self.search)
+        return products.order_by(*SORT_ORDERS[self.sort])
+
+
+def id_list_key(category_id, gender, sort):
+    return f'shop:ids:{category_id or "-"}:{gender or "-"}:{sort}'
+
+
+def product_ids(spec, category=None):
+    """Упорядоченный список id товаров для категории, пола и сортировки спецификации.
+
+    Список строится одним запросом по индексу и хранится в кэше до
+    изменения товаров этой категории или этого пола.
+    """
+    key = id_list_key(category.pk if category else None, spec.gender, spec.sort)
+    return get_or_compute(
+        key, lambda: list(spec.queryset(category).values_list('id', flat=True)), ID_LIST_TIMEOUT
+    )
+
+
+def evict_product_ids(category_ids=(), genders=()):
+    """Сбрасывает списки id, в которые могут входить товары этих категорий и пола"""
+    keys = [
+        id_list_key(category_id, gender, sort)
+        for category_id in {None, *category_ids}
+        for gender in {None, *genders}
+        for sort in SORT_ORDERS
+    ]
+    cache.delete_many(keys)
+
+
+def products_by_ids(ids):
+    """Товары для карточек в порядке ids одним запросом по первичному ключу"""
+    products = Product.objects.cards(*SORT_KEY_FIELDS).in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+class IdListPaginator(Paginator):
+    """Paginator по списку id: страница - срез списка, товары загружаются через in_bulk"""
+
+    def _get_page(self, object_list, *args, **kwargs):
+        # Список может быть массивом NumPy (см. memory_catalog)
+        ids = [int(pk) for pk in object_list]
+        return super()._get_page(products_by_ids(ids), *args, **kwargs)
+
+
+@contextmanager
+def instrument(endpoint, spec):
+    """Пишет в лог shop.catalog время обработки запроса каталога по ключу спецификации"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.debug(
+            '%s spec=%s %.1f ms', endpoint, spec.key, (time.perf_counter() - started) * 1000
+        )
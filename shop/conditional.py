@@ -0,0 +1,72 @@
+"""Валидаторы условных GET-запросов (ETag и Last-Modified).
+
+Валидаторы строятся из дешёвых метаданных: версий в кэше и одной
+строки товара, поэтому ответ 304 отдаётся до тяжёлых запросов и
+рендера. Используются с декоратором django.views.decorators.http.condition.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from django.db.models import Count, Max
+
+from .cache import get_catalog_changed_at, get_catalog_version, get_version, images_version_key, reviews_version_key
+from .models import Product
+
+
+def _digest(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def listing_etag(request, *args, **kwargs):
+    """Списки товаров: версия каталога и полный запрос (с признаком HX-Request)"""
+    return _digest(get_catalog_version(), bool(request.headers.get('HX-Request')), request.get_full_path())
+
+
+def listing_last_modified(request, *args, **kwargs):
+    changed_at = get_catalog_changed_at()
+    return datetime.fromtimestamp(changed_at, tz=timezone.utc) if changed_at is not None else None
+
+
+def _product_stamp(request, slug):
+    # etag_func и last_modified_func вызываются по очереди: строка товара читается один раз
+    stamps = getattr(request, '_product_stamps', None)
+    if stamps is None:
+        stamps = request._product_stamps = {}
+    if slug not in stamps:
+        stamps[slug] = Product.objects.filter(slug=slug).values_list(
+            'pk', 'updated_at', 'category__updated_at'
+        ).first()
+    return stamps[slug]
+
+
+def product_etag(request, slug):
+    """Страница товара: изменение товара, его категории, отзывов и изображений"""
+    stamp = _product_stamp(request, slug)
+    if stamp is None:
+        return None
+    pk, updated_at, category_updated_at = stamp
+    return _digest(
+        pk, updated_at, category_updated_at, bool(request.headers.get('HX-Request')),
+        get_version(reviews_version_key(pk)), get_version(images_version_key(pk)),
+    )
+
+
+def product_last_modified(request, slug):
+    stamp = _product_stamp(request, slug)
+    return max(stamp[1], stamp[2]) if stamp is not None else None
+
+
+def favorite_ids(request):
+    """id товаров из параметра ids=1,2,3"""
+    return sorted({int(value) for value in request.GET.get('ids', '').split(',') if value.strip().isdecimal()})
+
+
+def favorites_etag(request, *args, **kwargs):
+    """Данные избранного: число найденных товаров и последние изменения их и категорий"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    ids = favorite_ids(request)
+    stamp = Product.objects.filter(pk__in=ids).aggregate(
+        count=Count('pk'), updated_at=Max('updated_at'), category_updated_at=Max('category__updated_at')
+    )
+    return _digest(ids, stamp['count'], stamp['updated_at'], stamp['category_updated_at'])
@@ -0,0 +1,167 @@
+"""Счётчики фасетов каталога (категория, пол, размер, цвет, цена).
+
+Все счётчики считаются одним запросом: товары выбираются один раз в
+CTE, а каждый фасет - отдельная группировка по нему. Счётчик фасета
+учитывает все фильтры, кроме фильтра самого фасета, чтобы были видны
+и соседние значения (другие категории, другой пол).
+
+С фильтром "в наличии" размеры и цвета считаются по вариантам с
+остатком, как в CatalogSpec.queryset(): размер M учитывается, только если
+есть вариант M (выбранного цвета) с ненулевым остатком.
+"""
+import dataclasses
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+
+from .cache import get_catalog_version, get_or_compute
+from .models import Product, ProductVariant
+from .reference import active_categories
+
+
+# Границы ценовых диапазонов, сум
+PRICE_BANDS = (100000, 300000, 500000, 1000000)
+FACETS_CACHE_TIMEOUT = 60 * 15
+_VARIANT_IN_STOCK = 'variant.product_id = base.id AND variant.stock > 0'
+
+
+def price_band_labels():
+    """Подписи диапазонов в порядке номеров width_bucket (0 - ниже первой границы)"""
+    labels = [f'до {PRICE_BANDS[0]:,}'.replace(',', ' ')]
+    for low, high in zip(PRICE_BANDS, PRICE_BANDS[1:]):
+        labels.append(f'{low:,} - {high:,}'.replace(',', ' '))
+    labels.append(f'от {PRICE_BANDS[-1]:,}'.replace(',', ' '))
+    return labels
+
+
+def _conditions(spec, category):
+    """SQL-условия фильтров каждого фасета с параметрами"""
+    conditions = {'category': [], 'gender': [], 'size': [], 'color': [], 'in_stock': []}
+    if category is not None:
+        conditions['category'].append(('category_id = %s', [category.pk]))
+    if spec.categories:
+        conditions['category'].append(('category_id = ANY(%s)', [list(spec.categories)]))
+    if spec.gender:
+        conditions['gender'].append(('gender = %s', [spec.gender]))
+    if spec.size:
+        conditions['size'].append(('sizes @> ARRAY[%s]::varchar[]', [spec.size]))
+    if spec.color:
+        conditions['color'].append(('colors @> ARRAY[%s]::varchar[]', [spec.color]))
+    if spec.in_stock:
+        # Есть вариант с остатком в выбранном размере и цвете, как в CatalogSpec.queryset()
+        sql = f'EXISTS (SELECT 1 FROM {ProductVariant._meta.db_table} AS variant WHERE {_VARIANT_IN_STOCK}'
+        params = []
+        for field in ('size', 'color'):
+            if getattr(spec, field):
+                sql += f' AND variant.{field} = %s'
+                params.append(getattr(spec, field))
+        conditions['in_stock'].append((sql + ')', params))
+    return conditions
+
+
+def _filter_except(conditions, excluded):
+    """Условие FILTER для фасета: все фильтры, кроме фильтров из excluded"""
+    parts = [part for name, items in conditions.items() if name not in excluded for part in items]
+    return ' AND '.join(sql for sql, _ in parts) or 'TRUE', [param for _, params in parts for param in params]
+
+
+def _in_stock_variants(spec, facet):
+    """FROM-часть фасета размера или цвета по вариантам с остатком"""
+    other = 'color' if facet == 'size' else 'size'
+    sql = f'base JOIN {ProductVariant._meta.db_table} AS variant ON {_VARIANT_IN_STOCK}'
+    if getattr(spec, other):
+        return f'{sql} AND variant.{other} = %s', [getattr(spec, other)]
+    return sql, []
+
+
+def _count_facets(spec, category):
+    # Общая часть выборки - всё, кроме фильтров фасетов и наличия (поиск, скидка)
+    scope = dataclasses.replace(spec, category='', categories=(), gender='', size='', color='', in_stock=False)
+    base = scope.queryset().order_by().values('id', 'category_id', 'gender', 'price', 'sizes', 'colors')
+    groups = {
+        'category': ('category_id::text', 'base'),
+        'gender': ('gender', 'base'),
+        'price': ('width_bucket(price, %s::numeric[])::text', 'base'),
+        'size': ('value', 'base, unnest(sizes) AS value'),
+        'color': ('value', 'base, unnest(colors) AS value'),
+    }
+    counts = {facet: {} for facet in groups}
+    try:
+        base_sql, params = base.query.sql_with_params()
+    except EmptyResultSet:
+        # Условие заведомо ложно (например, поиск без слов)
+        return counts
+    params = list(params)
+    conditions = _conditions(spec, category)
+
+    selects = []
+    for facet, (value_sql, from_sql) in groups.items():
+        from_params = []
+        count_sql = 'count(*)'
+        excluded = {facet}
+        if spec.in_stock and facet in ('size', 'color'):
+            value_sql, count_sql = f'variant.{facet}', 'count(DISTINCT base.id)'
+            from_sql, from_params = _in_stock_variants(spec, facet)
+            excluded.add('in_stock')
+        filter_sql, filter_params = _filter_except(conditions, excluded)
+        selects.append(
+            f"SELECT '{facet}', {value_sql}, {count_sql} FILTER (WHERE {filter_sql}) FROM {from_sql} GROUP BY 2"
+        )
+        if facet == 'price':
+            params.append(list(PRICE_BANDS))
+        params.extend(filter_params)
+        params.extend(from_params)
+    sql = f'WITH base AS MATERIALIZED ({base_sql}) ' + ' UNION ALL '.join(selects)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for facet, value, count in cursor.fetchall():
+            if value:
+                counts[facet][value] = count
+    return counts
+
+
+def get_facets(spec, category=None):
+    """Фасеты каталога: значения (значение, подпись, количество) и параметры ссылок.
+
+    Результат кэшируется до следующего изменения каталога; после него
+    прежний результат отдается, пока новый считается в фоне.
+    """
+    key = f'shop:facets:{spec.filter_key}'
+    counts = get_or_compute(
+        key, lambda: _count_facets(spec, category), FACETS_CACHE_TIMEOUT, version=get_catalog_version()
+    )
+
+    sizes = [code for code, _ in Product.SIZE_CHOICES]
+    values = {
+        'category': [
+            (cat.slug, cat.name, counts['category'].get(str(cat.pk), 0))
+            for cat in active_categories()
+        ],
+        'gender': [
+            (code, label, counts['gender'].get(code, 0)) for code, label in Product.GENDER_CHOICES
+        ],
+        'size': [(size, size, counts['size'].get(size, 0)) for size in sizes] + [
+            (size, size, count) for size, count in counts['size'].items() if size not in sizes
+        ],
+        'color': sorted(
+            ((color, color, count) for color, count in counts['color'].items()),
+            key=lambda item: -item[2],
+        ),
+        'price': [
+            (str(band), label, counts['price'].get(str(band), 0))
+            for band, label in enumerate(price_band_labels())
+        ],
+    }
+    # Параметры ссылок фасета: текущие фильтры без фильтра самого фасета
+    cleared = {
+        'category': {'category': '', 'categories': ()},
+        'gender': {'gender': ''},
+        'size': {'size': ''},
+        'color': {'color': ''},
+        'price': {},
+    }
+    return {
+        facet: {'values': values[facet], 'params': dataclasses.replace(spec, **cleared[facet]).query_params}
+        for facet in values
+    }
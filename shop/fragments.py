@@ -0,0 +1,90 @@
+"""Кэшируемые фрагменты HTML.
+
+HTMX-фрагменты страницы товара загружаются после оболочки; каждый
+кэшируется под своим ключем (в ключ входит версия данных, от которых он
+зависит). Карточки товаров в списках кэшируются по одной и достаются
+одним запросом к кэшу на страницу. Время подготовки пишется в лог
+shop.fragments вместе с признаком попадания в кэш.
+"""
+import hashlib
+import logging
+import time
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.safestring import mark_safe
+
+from .cache import record_stats
+
+
+logger = logging.getLogger('shop.fragments')
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+
+def render_fragment(request, name, key, template_name, get_context):
+    """Ответ с HTML фрагмента name из кэша или отрендеренный из get_context().
+
+    Ключ фрагмента служит и его ETag: если он совпал с If-None-Match,
+    возвращается 304 без обращения к кэшу и рендера.
+    """
+    started = time.perf_counter()
+    cache_key = f'shop:fragment:{name}:{key}'
+    etag = quote_etag(hashlib.md5(cache_key.encode()).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    html = cache.get(cache_key)
+    hit = html is not None
+    if not hit:
+        html = render_to_string(template_name, get_context(), request=request)
+        cache.set(cache_key, html, FRAGMENT_CACHE_TIMEOUT)
+    logger.debug(
+        '%s key=%s %s %.1f ms', name, key, 'hit' if hit else 'miss', (time.perf_counter() - started) * 1000
+    )
+    response = HttpResponse(html)
+    response['ETag'] = etag
+    return response
+
+
+CARD_TEMPLATE = 'shop/partials/product_card.html'
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+CARD_STATS = ('hits', 'misses', 'render_us')
+
+
+@lru_cache(maxsize=None)
+def card_template_version(template_name=CARD_TEMPLATE):
+    """Хэш исходника шаблона карточки: после его изменения ключи карточек меняются"""
+    return hashlib.md5(get_template(template_name).template.source.encode()).hexdigest()[:8]
+
+
+def card_key(product, template_name=CARD_TEMPLATE):
+    return f'shop:card:{card_template_version(template_name)}:{product.pk}:{product.updated_at.timestamp()}'
+
+
+def render_cards(products, template_name=CARD_TEMPLATE):
+    """HTML карточек товаров (из cards() с updated_at) в их порядке"""
+    started = time.perf_counter()
+    products = list(products)
+    keys = [card_key(product, template_name) for product in products]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    render_started = time.perf_counter()
+    template = get_template(template_name)
+    for product, key in zip(products, keys):
+        if key not in cached and key not in missing:
+            missing[key] = template.render({'product': product})
+    render_us = int((time.perf_counter() - render_started) * 1_000_000)
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+
+    record_stats('cards', hits=len(products) - len(missing), misses=len(missing), render_us=render_us)
+    logger.debug(
+        'cards n=%d hits=%d %.1f ms', len(products), len(products) - len(missing),
+        (time.perf_counter() - started) * 1000,
+    )
+    return [mark_safe(cached.get(key) or missing[key]) for key in keys]
@@ -0,0 +1,120 @@
+"""Шина сброса кэшей процессов через LISTEN/NOTIFY Postgres.
+
+Кэши в памяти процесса (справочники, снимок каталога) не видят изменений,
+сделанных в других воркерах и на других серверах. Сигналы post_save и
+post_delete моделей магазина публикуют событие pg_notify в канал
+CHANNEL (оно доставляется после фиксации транзакции), а поток-слушатель
+каждого процесса вызывает обработчики, подписанные на модель.
+
+Включается настройкой SHOP_INVALIDATION_BUS. Слушатель запускается в
+каждом процессе при готовности приложения, поэтому gunicorn нельзя
+запускать с --preload (поток не переживает fork).
+"""
+import json
+import logging
+import os
+import select
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+logger = logging.getLogger('shop.invalidation')
+
+CHANNEL = 'shop_invalidation'
+POLL_TIMEOUT = 5
+RECONNECT_DELAY = 1
+
+_handlers = {}
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'SHOP_INVALIDATION_BUS', False)
+
+
+def subscribe(model_label, handler):
+    """Вызывать handler(model_label, pk) при изменении модели model_label ('shop.product') в любом процессе.
+
+    После переподключения слушателя handler вызывается с pk=None: события
+    за время без соединения потеряны, сбросить нужно всё.
+    """
+    _handlers.setdefault(model_label, []).append(handler)
+
+
+def publish(instance, using=DEFAULT_DB_ALIAS):
+    """Публикует изменение объекта; событие уходит вместе с фиксацией текущей транзакции"""
+    payload = json.dumps({'model': instance._meta.label_lower, 'pk': instance.pk, 'pid': os.getpid()})
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+
+
+def dispatch(model_label, pk):
+    for handler in _handlers.get(model_label, ()):
+        try:
+            handler(model_label, pk)
+        except Exception:
+            logger.exception('Обработчик события %s:%s завершился ошибкой', model_label, pk)
+
+
+class InvalidationListener(threading.Thread):
+    """Поток процесса, который слушает CHANNEL на отдельном соединении с БД"""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        super().__init__(name='shop-invalidation', daemon=True)
+        self.using = using
+        self.listening = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            # Отдельная обертка соединения: соединения Django привязаны к потоку запроса
+            wrapper = connections.create_connection(self.using)
+            try:
+                wrapper.ensure_connection()
+                wrapper.set_autocommit(True)
+                with wrapper.connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                # События, пропущенные без соединения, не восстановить: сбрасываем всё
+                if self.listening.is_set():
+                    for model_label in list(_handlers):
+                        dispatch(model_label, None)
+                self.listening.set()
+                self._listen(wrapper.connection)
+            except Exception:
+                logger.exception('Слушатель %s потерял соединение, переподключение', CHANNEL)
+                self._stopped.wait(RECONNECT_DELAY)
+            finally:
+                wrapper.close()
+
+    def _listen(self, raw_connection):
+        while not self._stopped.is_set():
+            if select.select([raw_connection], [], [], POLL_TIMEOUT) == ([], [], []):
+                continue
+            raw_connection.poll()
+            while raw_connection.notifies:
+                notify = raw_connection.notifies.pop(0)
+                try:
+                    event = json.loads(notify.payload)
+                except ValueError:
+                    logger.warning('Некорректное событие %r', notify.payload)
+                    continue
+                dispatch(event['model'], event['pk'])
+
+
+def start_listener(timeout=None):
+    """Запускает слушатель процесса (один на процесс); timeout - ждать начала прослушивания"""
+    global _listener
+    with _listener_lock:
+        # После fork поток родителя в дочернем процессе не работает (is_alive() - False)
+        if _listener is None or not _listener.is_alive():
+            _listener = InvalidationListener()
+            _listener.start()
+    if timeout is not None:
+        _listener.listening.wait(timeout)
+    return _listener
@@ -0,0 +1,43 @@
+from shop.benchmarks import BenchmarkCommand, measure, summarize, synthetic_catalog
+from shop.models import Product
+from shop.search import autocomplete_products
+
+
+class Command(BenchmarkCommand):
+    help = 'Замеряет задержку автодополнения поиска на синтетическом каталоге'
+
+    # Префиксы, подстроки, опечатки, другой алфавит и совпадения по категории
+    QUERIES = [
+        'пл', 'плат', 'платье', 'платъе', 'руба', 'jack', 'jaket', 'латье',
+        'куртки', 'vintage sh', 'platye', 'kurtka',
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Размер синтетического каталога')
+        parser.add_argument('--repeat', type=int, default=50, help='Повторов на каждый запрос')
+        parser.add_argument('--budget', type=float, default=10.0, help='Допустимая задержка p95, мс')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Создаем синтетический каталог: {options["products"]} товаров...')
+
+        with synthetic_catalog(options['products']):
+            over_budget = []
+            for query in self.QUERIES:
+                def run():
+                    return list(autocomplete_products(Product.objects.select_related('category'), query))
+
+                results = run()
+                stats = summarize(measure(run, options['repeat']))
+                self.stdout.write(
+                    f'{query!r:14} найдено {len(results)}  '
+                    f'p50 {stats["p50"]:.2f} мс  p95 {stats["p95"]:.2f} мс  max {stats["max"]:.2f} мс'
+                )
+                if stats['p95'] > options['budget']:
+                    over_budget.append(query)
+
+        if over_budget:
+            self.stdout.write(self.style.WARNING(
+                f'Превышен бюджет {options["budget"]} мс: {", ".join(over_budget)}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Все запросы уложились в бюджет'))
@@ -0,0 +1,51 @@
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Repeat
+from shop.benchmarks import BenchmarkCommand, measure, summarize, synthetic_catalog
+from shop.models import Product
+
+
+def fetched_bytes(queryset):
+    """Примерный объём строк, которые БД отдаёт на запрос (сумма длин значений)"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return sum(len(str(value).encode()) for row in cursor.fetchall() for value in row if value is not None)
+
+
+class Command(BenchmarkCommand):
+    help = 'Сравнивает загрузку страницы карточек полными строками Product и проекцией cards()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000, help='Размер синтетического каталога')
+        parser.add_argument('--description', type=int, default=2000, help='Длина описания товара, символов')
+        parser.add_argument('--page-size', type=int, default=24, help='Товаров на странице')
+        parser.add_argument('--repeat', type=int, default=50, help='Повторов на каждый запрос')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Создаем синтетический каталог: {options["products"]} товаров...')
+
+        with synthetic_catalog(options['products']):
+            # Описания реальных товаров длиннее синтетических
+            Product.objects.update(description=Repeat(Concat(F('description'), Value(' ')), options['description'] // 50))
+            page_size = options['page_size']
+            pages = {
+                'первая страница': 0,
+                'середина каталога': options['products'] // 2,
+            }
+
+            for label, offset in pages.items():
+                # Страница загружается по списку id, как в каталоге (products_by_ids)
+                ordered = Product.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+                ids = list(ordered[offset:offset + page_size])
+                full = Product.objects.filter(pk__in=ids)
+                cards = Product.objects.cards().filter(pk__in=ids)
+
+                full_bytes, cards_bytes = fetched_bytes(full), fetched_bytes(cards)
+                full_time = summarize(measure(lambda: list(full.all()), options['repeat']))
+                cards_time = summarize(measure(lambda: list(cards.all()), options['repeat']))
+                self.stdout.write(
+                    f'{label:18} строки {full_bytes // 1024:5} КБ -> {cards_bytes // 1024:4} КБ  '
+                    f'p50 {full_time["p50"]:6.2f} мс -> {cards_time["p50"]:6.2f} мс  '
+                    f'(экономия {full_bytes - cards_bytes} байт, {full_time["p50"] - cards_time["p50"]:.2f} мс)'
+                )
@@ -0,0 +1,60 @@
+from django.core.management.base import CommandError
+from shop.benchmarks import BenchmarkCommand, measure, summarize, synthetic_catalog
+from shop.cache import get_catalog_version
+from shop.catalog import CatalogSpec
+from shop.memory_catalog import CatalogSnapshot, np
+from shop.pagination import SORT_ORDERS
+
+
+class Command(BenchmarkCommand):
+    help = 'Сравнивает фильтрацию и сортировку каталога в Postgres и в памяти процесса (NumPy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Размер синтетического каталога')
+        parser.add_argument('--repeat', type=int, default=30, help='Повторов на каждый запрос')
+        parser.add_argument('--page', type=int, default=50, help='Номер страницы для замера')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('Для каталога в памяти нужен NumPy')
+
+        self.stdout.write(f'Создаем синтетический каталог: {options["products"]} товаров...')
+
+        with synthetic_catalog(options['products']) as categories:
+            snapshot = CatalogSnapshot.load(get_catalog_version())
+            load = summarize(measure(lambda: CatalogSnapshot.load(get_catalog_version()), 3))
+            self.stdout.write(f'Загрузка снимка: {load["p50"]:.1f} мс, {snapshot.nbytes // 1024} КБ')
+
+            filters = {
+                'все товары': {},
+                'категория': {'category': categories[0].slug},
+                'пол': {'gender': 'women'},
+                'категория + пол': {'category': categories[0].slug, 'gender': 'women'},
+                '3 категории': {'categories': ','.join(str(c.pk) for c in categories[:3])},
+            }
+
+            for label, params in filters.items():
+                for sort_by in SORT_ORDERS:
+                    spec = CatalogSpec.from_query({**params, 'sort': sort_by})
+                    category = spec.get_category()
+                    offset = (options['page'] - 1) * spec.page_size
+
+                    def run_sql():
+                        queryset = spec.queryset(category).values_list('id', flat=True)
+                        return queryset.count(), list(queryset[offset:offset + spec.page_size])
+
+                    def run_memory():
+                        ids = snapshot.product_ids(spec, category)
+                        return len(ids), ids[offset:offset + spec.page_size].tolist()
+
+                    if run_sql() != run_memory():
+                        raise CommandError(f'Результаты расходятся: {label} / {sort_by}')
+
+                    sql = summarize(measure(run_sql, options['repeat']))
+                    memory = summarize(measure(run_memory, options['repeat']))
+                    self.stdout.write(
+                        f'{label:16} {sort_by:11} SQL p50 {sql["p50"]:7.2f} мс  '
+                        f'NumPy p50 {memory["p50"]:7.2f} мс  x{sql["p50"] / memory["p50"]:.1f}'
+                    )
+
+        self.stdout.write(self.style.SUCCESS('Результаты SQL и NumPy совпадают'))
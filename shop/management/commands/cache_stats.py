@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from shop.cache import LOCAL_CACHE_STATS, get_stats
+from shop.fragments import CARD_STATS
+from shop.pages import PAGE_STATS
+from shop.querycache import QUERY_STATS, query_fingerprints
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания в кэши страниц, фрагментов, справочников и запросов'
+
+    def handle(self, *args, **options):
+        cards = get_stats('cards', CARD_STATS)
+        total = cards['hits'] + cards['misses']
+        ratio = cards['hits'] / total * 100 if total else 0
+        # Экономия: попадания, умноженные на среднее время рендера карточки при промахе
+        render_ms = cards['render_us'] / cards['misses'] / 1000 if cards['misses'] else 0
+        self.stdout.write(
+            f'Карточки товаров: {cards["hits"]} попаданий, {cards["misses"]} промахов ({ratio:.1f}%), '
+            f'рендер {render_ms:.3f} мс/карточка, сэкономлено ~{cards["hits"] * render_ms:.0f} мс'
+        )
+
+        pages = get_stats('pages', PAGE_STATS)
+        total = pages['hits'] + pages['misses']
+        ratio = pages['hits'] / total * 100 if total else 0
+        self.stdout.write(
+            f'Страницы: {pages["hits"]} попаданий, {pages["misses"]} промахов ({ratio:.1f}%), '
+            f'{pages["bypass"]} без кэша (сессия или параметры)'
+        )
+
+        reference = get_stats('reference', LOCAL_CACHE_STATS)
+        total = sum(reference.values())
+        for tier, counter in (('память процесса', 'local_hits'), ('общий кэш', 'shared_hits')):
+            ratio = reference[counter] / total * 100 if total else 0
+            self.stdout.write(f'Справочники, {tier}: {reference[counter]} попаданий ({ratio:.1f}%)')
+        self.stdout.write(f'Справочники, промахи: {reference["misses"]}')
+
+        for fp, sql in query_fingerprints().items():
+            query = get_stats(f'query:{fp}', QUERY_STATS)
+            total = query['hits'] + query['misses']
+            ratio = query['hits'] / total * 100 if total else 0
+            self.stdout.write(
+                f'Запрос {fp}: {query["hits"]}/{total} ({ratio:.1f}%), без кэша {query["bypass"]}  {sql[:100]}'
+            )
@@ -0,0 +1,32 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.cache import bump_catalog_version
+from shop.related import RELATED_LIMIT, changed_products, compute_related, np
+
+
+class Command(BaseCommand):
+    help = 'Предрасчитывает похожие товары (категория, пол, цена, TF-IDF названий и описаний)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать все товары, а не только изменённые')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Число процессов')
+        parser.add_argument('--limit', type=int, default=RELATED_LIMIT, help='Похожих товаров на товар')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('Для расчёта похожих товаров нужен NumPy')
+
+        started = time.perf_counter()
+        product_ids = None if options['full'] else changed_products()
+        if product_ids is not None and not product_ids:
+            self.stdout.write(self.style.SUCCESS('Изменённых товаров нет'))
+            return
+
+        count = compute_related(product_ids, workers=options['workers'], limit=options['limit'])
+        if count:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие товары посчитаны для {count} товаров за {time.perf_counter() - started:.1f} с'
+        ))
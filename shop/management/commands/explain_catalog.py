@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import CommandError
+from django.db import connection
+from shop.benchmarks import BenchmarkCommand, synthetic_catalog
+from shop.catalog import CatalogSpec
+from shop.pagination import SORT_ORDERS
+
+
+def plan_nodes(plan):
+    """Все узлы плана запроса (обход в глубину)"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+class Command(BenchmarkCommand):
+    help = 'Выполняет EXPLAIN ANALYZE запросов каталога для всех комбинаций фильтров и сортировок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Размер синтетического каталога')
+        parser.add_argument('--verbose-plans', action='store_true', help='Печатать полный план каждого запроса')
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+            result = cursor.fetchone()[0]
+        if isinstance(result, str):
+            result = json.loads(result)
+        return result[0]
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Создаем синтетический каталог: {options["products"]} товаров...')
+
+        regressions = []
+        with synthetic_catalog(options['products']) as categories:
+            category = categories[0]
+            filters = {
+                'все товары': {},
+                'категория': {'category': category.slug},
+                'пол': {'gender': 'women'},
+                'категория + пол': {'category': category.slug, 'gender': 'women'},
+            }
+
+            for label, params in filters.items():
+                for sort_by in SORT_ORDERS:
+                    spec = CatalogSpec.from_query({**params, 'sort': sort_by})
+                    queryset = spec.queryset(spec.get_category())[:spec.page_size]
+                    result = self.explain(queryset)
+
+                    nodes = list(plan_nodes(result['Plan']))
+                    types = {node['Node Type'] for node in nodes}
+                    indexes = sorted({node['Index Name'] for node in nodes if 'Index Name' in node})
+                    ordered = not types & {'Sort', 'Incremental Sort'} and bool(indexes)
+
+                    status = self.style.SUCCESS('OK ') if ordered else self.style.ERROR('SORT')
+                    self.stdout.write(
+                        f'{status} {label:16} {sort_by:11} {result["Execution Time"]:8.2f} мс  '
+                        f'{", ".join(indexes) or ", ".join(sorted(types))}'
+                    )
+                    if options['verbose_plans']:
+                        self.stdout.write(json.dumps(result['Plan'], indent=2, ensure_ascii=False))
+                    if not ordered:
+                        regressions.append(f'{label} / {sort_by}')
+
+        if regressions:
+            raise CommandError(f'Запросы без упорядоченного индексного плана: {"; ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Все запросы каталога используют упорядоченный индекс'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from shop.models import Category, Product, SearchWord
+from shop.text import normalize_search_text
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает нормализованные названия товаров и категорий для поиска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки обновления')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        for model in (Category, Product):
+            updated = 0
+            batch = []
+            for obj in model.objects.only('name', 'search_name').order_by('pk').iterator(chunk_size=batch_size):
+                search_name = normalize_search_text(obj.name)
+                if obj.search_name != search_name:
+                    obj.search_name = search_name
+                    batch.append(obj)
+                if len(batch) >= batch_size:
+                    model.objects.bulk_update(batch, ['search_name'])
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                model.objects.bulk_update(batch, ['search_name'])
+                updated += len(batch)
+            self.stdout.write(f'{model._meta.verbose_name_plural}: обновлено {updated}')
+
+        count = SearchWord.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Готово, словарь поиска: {count} слов'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shop.models import SearchWord
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает словарь поиска по названиям товаров'
+
+    def handle(self, *args, **options):
+        count = SearchWord.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Словарь поиска пересобран: {count} слов'))
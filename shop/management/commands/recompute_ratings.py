@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from shop.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги товаров (средняя оценка, число отзывов, гистограмма) по отзывам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пакета bulk_update')
+
+    def handle(self, *args, **options):
+        count = recompute_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Рейтинги пересчитаны: исправлено товаров {count}'))
@@ -0,0 +1,136 @@
+"""Каталог в памяти процесса для фильтрации и сортировки без Postgres.
+
+Столбцы, которые нужны фильтрам и сортировкам каталога, хранятся в
+массивах NumPy. Фильтры считаются векторными масками, а порядок для
+каждой сортировки вычисляется один раз при загрузке. ORM загружает
+только товары нужной страницы. Снимок перечитывается, когда меняется
+версия каталога или по шине сброса кэшей приходит изменение товара или
+отзыва (версия в LocMemCache не видна другим процессам).
+
+Включается настройкой SHOP_MEMORY_CATALOG; без NumPy модуль отключён.
+"""
+import threading
+
+from django.conf import settings
+
+from .cache import get_catalog_version
+from .invalidation import subscribe
+from .models import Product
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+GENDER_CODES = {code: index for index, (code, _) in enumerate(Product.GENDER_CHOICES)}
+
+
+def is_enabled():
+    return np is not None and getattr(settings, 'SHOP_MEMORY_CATALOG', False)
+
+
+class CatalogSnapshot:
+    """Столбцы товаров и готовые порядки сортировки на момент загрузки"""
+
+    def __init__(self, version, rows):
+        # rows упорядочены по ('name', 'id'), как сортировка каталога по имени
+        self.version = version
+        count = len(rows)
+        self.ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        self.price = np.fromiter((row[1] for row in rows), dtype=np.float64, count=count)
+        self.category = np.fromiter((row[2] for row in rows), dtype=np.int64, count=count)
+        self.gender = np.fromiter((GENDER_CODES.get(row[3], -1) for row in rows), dtype=np.int8, count=count)
+        self.created = np.fromiter((row[4].timestamp() for row in rows), dtype=np.float64, count=count)
+        self.name_rank = np.arange(count, dtype=np.int64)
+        self.discount = np.fromiter((row[5] for row in rows), dtype=np.int16, count=count)
+        self.rating = np.fromiter((row[6] for row in rows), dtype=np.float64, count=count)
+
+        # Позиции строк в порядке каждой сортировки из SORT_ORDERS
+        self.orders = {
+            'name': self.name_rank,
+            'price-low': np.lexsort((self.ids, self.price)),
+            'price-high': np.lexsort((-self.ids, -self.price)),
+            'newest': np.lexsort((-self.ids, -self.created)),
+            'rating': np.lexsort((-self.ids, -self.rating)),
+            'discount': np.lexsort((-self.ids, -self.discount)),
+        }
+
+    @property
+    def nbytes(self):
+        """Объём массивов снимка в байтах"""
+        columns = (self.ids, self.price, self.category, self.gender, self.created, self.rating, self.discount)
+        return sum(column.nbytes for column in (*columns, *self.orders.values()))
+
+    @classmethod
+    def load(cls, version):
+        rows = list(
+            Product.objects.order_by('name', 'id')
+            .values_list('id', 'price', 'category_id', 'gender', 'created_at', 'discount', 'avg_rating')
+        )
+        return cls(version, rows)
+
+    def product_ids(self, spec, category=None):
+        """id товаров спецификации в порядке её сортировки (массив NumPy)"""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if category is not None:
+            mask &= self.category == category.pk
+        if spec.categories:
+            mask &= np.isin(self.category, spec.categories)
+        if spec.gender:
+            mask &= self.gender == GENDER_CODES[spec.gender]
+        if spec.min_discount:
+            mask &= self.discount >= spec.min_discount
+        order = self.orders[spec.sort]
+        return self.ids[order[mask[order]]]
+
+
+class MemoryCatalog:
+    """Снимок каталога текущего процесса, обновляемый по версии каталога"""
+
+    def __init__(self):
+        self._snapshot = None
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, snapshot, version):
+        return snapshot is not None and snapshot.version == version and not self._stale
+
+    def snapshot(self):
+        version = get_catalog_version()
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot, version):
+            return snapshot
+        # Перечитывает снимок один поток; остальные пока работают со старым
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if not self._is_fresh(self._snapshot, version):
+                # Событие, пришедшее во время загрузки, снова пометит снимок устаревшим
+                self._stale = False
+                self._snapshot = CatalogSnapshot.load(version)
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        """Перечитать снимок при следующем запросе"""
+        self._stale = True
+
+    def product_ids(self, spec, category=None):
+        """id товаров спецификации или None, если её нельзя посчитать в памяти"""
+        if spec.search or spec.size or spec.color or spec.in_stock:
+            return None
+        return self.snapshot().product_ids(spec, category)
+
+
+memory_catalog = MemoryCatalog()
+
+
+def _invalidate_snapshot(model_label, pk):
+    memory_catalog.invalidate()
+
+
+# Рейтинг товара меняется вместе с отзывами запросом UPDATE, без post_save товара
+subscribe('shop.product', _invalidate_snapshot)
+subscribe('shop.review', _invalidate_snapshot)
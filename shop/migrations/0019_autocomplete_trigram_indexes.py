@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:13
+
+import re
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def fill_search_words(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    SearchWord = apps.get_model('shop', 'SearchWord')
+
+    words = set()
+    for name in Product.objects.values_list('name', flat=True).iterator():
+        words |= {
+            word for word in re.findall(r'\w+', name.lower())
+            if 3 <= len(word) <= 100 and not word.isdigit()
+        }
+    SearchWord.objects.bulk_create([SearchWord(word=word) for word in words], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_product_search_vector'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.CreateModel(
+            name='SearchWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=100, unique=True, verbose_name='Слово')),
+            ],
+            options={
+                'verbose_name': 'Поисковое слово',
+                'verbose_name_plural': 'Поисковые слова',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('name'), name='gin_trgm_ops'), name='shop_category_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('name'), name='gin_trgm_ops'), name='shop_product_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('name'), name='text_pattern_ops'), name='shop_product_name_prefix'),
+        ),
+        migrations.AddIndex(
+            model_name='searchword',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('word', name='gin_trgm_ops'), name='shop_searchword_trgm'),
+        ),
+        migrations.RunPython(fill_search_words, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+from shop.text import normalize_search_text
+
+
+def fill_search_names(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Category = apps.get_model('shop', 'Category')
+    SearchWord = apps.get_model('shop', 'SearchWord')
+
+    for model in (Category, Product):
+        objects = list(model.objects.only('name'))
+        for obj in objects:
+            obj.search_name = normalize_search_text(obj.name)
+        model.objects.bulk_update(objects, ['search_name'], batch_size=1000)
+
+    # Словарь опечаток теперь хранит нормализованные слова
+    words = set()
+    for search_name in Product.objects.values_list('search_name', flat=True).iterator():
+        words |= {word for word in search_name.split() if 3 <= len(word) <= 100 and not word.isdigit()}
+    SearchWord.objects.all().delete()
+    SearchWord.objects.bulk_create([SearchWord(word=word) for word in words], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_autocomplete_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='category',
+            name='shop_category_name_trgm',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_product_name_trgm',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_product_name_prefix',
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='search_name',
+            field=models.CharField(blank=True, editable=False, max_length=200, verbose_name='Название для поиска'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='search_name',
+            field=models.CharField(blank=True, editable=False, max_length=400, verbose_name='Название для поиска'),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        # Generated-столбец нельзя изменить на месте: пересоздаём вместе с индексом
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_product_search_gin',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='search_vector',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='russian', weight='A'), '||', django.contrib.postgres.search.SearchVector('name', config='english', weight='A'), django.contrib.postgres.search.SearchConfig('russian')), '||', django.contrib.postgres.search.SearchVector('search_name', config='simple', weight='A'), django.contrib.postgres.search.SearchConfig('russian')), '||', django.contrib.postgres.search.SearchVector('description', config='russian', weight='B'), django.contrib.postgres.search.SearchConfig('russian')), '||', django.contrib.postgres.search.SearchVector('description', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('russian')), output_field=django.contrib.postgres.search.SearchVectorField(), verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='shop_product_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('search_name', name='gin_trgm_ops'), name='shop_category_search_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('search_name', name='gin_trgm_ops'), name='shop_product_search_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.contrib.postgres.indexes.OpClass('search_name', name='varchar_pattern_ops'), name='shop_product_search_prefix'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:28
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_catalog_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='colors',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(models.Func(models.Func(models.Func(django.db.models.functions.text.Lower('available_colors'), function='btrim'), models.Value('\\s*,\\s*'), models.Value(','), models.Value('g'), function='regexp_replace'), models.Value(','), function='string_to_array'), models.Value(''), function='array_remove'), output_field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=200), size=None), verbose_name='Цвета'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sizes',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(models.Func(models.Func(models.Func(django.db.models.functions.text.Upper('available_sizes'), function='btrim'), models.Value('\\s*,\\s*'), models.Value(','), models.Value('g'), function='regexp_replace'), models.Value(','), function='string_to_array'), models.Value(''), function='array_remove'), output_field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=50), size=None), verbose_name='Размеры'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['sizes'], name='shop_product_sizes_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['colors'], name='shop_product_colors_gin'),
+        ),
+    ]
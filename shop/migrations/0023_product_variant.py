@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0022_product_sizes_colors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(max_length=64, unique=True, verbose_name='Артикул')),
+                ('size', models.CharField(max_length=50, verbose_name='Размер')),
+                ('color', models.CharField(max_length=200, verbose_name='Цвет')),
+                ('stock', models.PositiveIntegerField(default=0, verbose_name='Остаток')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='shop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Вариант товара',
+                'verbose_name_plural': 'Варианты товаров',
+                'ordering': ['size', 'color'],
+                'indexes': [models.Index(condition=models.Q(('stock__gt', 0)), fields=['product'], name='shop_variant_in_stock_idx'), models.Index(condition=models.Q(('stock__gt', 0)), fields=['size', 'product'], name='shop_variant_size_stock_idx'), models.Index(condition=models.Q(('stock__gt', 0)), fields=['color', 'product'], name='shop_variant_color_stock_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'size', 'color'), name='shop_variant_unique_option')],
+            },
+        ),
+    ]
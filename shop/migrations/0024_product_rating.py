@@ -0,0 +1,95 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:30
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_ratings(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Review = apps.get_model('shop', 'Review')
+
+    histograms = {}
+    counts = (
+        Review.objects.filter(is_approved=True)
+        .values_list('product_id', 'rating')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for product_id, rating, count in counts:
+        if 1 <= rating <= 5:
+            histograms.setdefault(product_id, {})[rating] = count
+
+    products = list(Product.objects.filter(pk__in=histograms))
+    for product in products:
+        histogram = histograms[product.pk]
+        product.review_count = sum(histogram.values())
+        total = sum(stars * count for stars, count in histogram.items())
+        product.avg_rating = (Decimal(total) / product.review_count).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        for stars, count in histogram.items():
+            setattr(product, f'rating_count_{stars}', count)
+    fields = ['avg_rating', 'review_count', *(f'rating_count_{stars}' for stars in range(1, 6))]
+    Product.objects.bulk_update(products, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0023_product_variant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_1',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок 1'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_2',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок 2'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_3',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок 3'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_4',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок 4'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_5',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок 5'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество отзывов'),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-avg_rating', '-id'], name='shop_product_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-avg_rating', '-id'], name='shop_product_cat_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['gender', '-avg_rating', '-id'], name='shop_product_gen_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'gender', '-avg_rating', '-id'], name='shop_product_cat_gen_rate_idx'),
+        ),
+    ]
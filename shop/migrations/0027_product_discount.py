@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:39
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0026_related_products'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(old_price__gt=models.F('price'), then=django.db.models.functions.comparison.Cast(django.db.models.functions.math.Floor(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('old_price'), '-', models.F('price')), '*', models.Value(100)), '/', models.F('old_price'))), models.SmallIntegerField())), default=models.Value(0)), output_field=models.SmallIntegerField(), verbose_name='Скидка, %'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-discount', '-id'], name='shop_product_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-discount', '-id'], name='shop_product_cat_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['gender', '-discount', '-id'], name='shop_product_gen_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'gender', '-discount', '-id'], name='shop_product_cat_gen_disc_idx'),
+        ),
+    ]
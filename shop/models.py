@@ -1,21 +1,50 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Cast, Concat, Floor, Lower, Upper
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.urls import reverse
 from django.utils.text import slugify
 
+from .cache import bump_catalog_version
+from .querycache import CachingQuerySet
+from .text import normalize_search_text
+
+
+def _csv_array(field, case):
+    """Выражение БД: строка "a, b,c" -> массив ['a', 'b', 'c'] в регистре case (Upper/Lower)"""
+    items = models.Func(
+        models.Func(
+            models.Func(case(field), function='btrim'),
+            models.Value(r'\s*,\s*'), models.Value(','), models.Value('g'),
+            function='regexp_replace',
+        ),
+        models.Value(','),
+        function='string_to_array',
+    )
+    return models.Func(items, models.Value(''), function='array_remove')
+
 
 class Category(models.Model):
     """Модель категории товаров"""
     name = models.CharField(max_length=100, verbose_name="Название")
     slug = models.SlugField(max_length=100, blank=True, null=True, verbose_name="URL")
+    search_name = models.CharField(max_length=200, blank=True, editable=False, verbose_name="Название для поиска")
     is_active = models.BooleanField(default=True, verbose_name="Активна")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
 
+    objects = CachingQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
         ordering = ['name']
+        indexes = [
+            GinIndex(OpClass('search_name', name='gin_trgm_ops'), name='shop_category_search_trgm'),
+        ]
 
     def __str__(self):
         return self.name
@@ -23,9 +52,26 @@ class Category(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        self.search_name = normalize_search_text(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_name'}
         super().save(*args, **kwargs)
 
 
+class ProductQuerySet(CachingQuerySet):
+    # Поля, которые выводит карточка товара в списках
+    CARD_FIELDS = ('id', 'slug', 'name', 'price', 'old_price', 'main_image', 'discount', 'updated_at')
+
+    def cards(self, *fields):
+        """Только колонки карточки (и fields) с адресом товара (url), собранным в БД"""
+        # Адрес собирается из префикса маршрута и slug: reverse() не вызывается на каждую карточку
+        prefix, _, suffix = reverse('shop:product_detail', args=['0']).rpartition('0')
+        return self.only(*self.CARD_FIELDS, *fields).annotate(
+            url=Concat(models.Value(prefix), 'slug', models.Value(suffix), output_field=models.CharField()),
+        )
+
+
 class Product(models.Model):
     """Модель товара"""
     SIZE_CHOICES = [
@@ -46,6 +92,7 @@ class Product(models.Model):
 
     name = models.CharField(max_length=200, verbose_name="Название")
     slug = models.SlugField(max_length=200, blank=True, null=True, verbose_name="URL")
+    search_name = models.CharField(max_length=400, blank=True, editable=False, verbose_name="Название для поиска")
     description = models.TextField(verbose_name="Описание")
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products', verbose_name="Категория")
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES, default='unisex', verbose_name="Пол")
@@ -57,14 +104,98 @@ class Product(models.Model):
     # Размеры и цвета
     available_sizes = models.CharField(max_length=50, default="S,M,L,XL", verbose_name="Доступные размеры")
     available_colors = models.CharField(max_length=200, default="white,blue,black", verbose_name="Доступные цвета")
+    # Нормализованные размеры и цвета для фильтров каталога (GIN-индексы)
+    sizes = models.GeneratedField(
+        expression=_csv_array('available_sizes', Upper),
+        output_field=ArrayField(models.CharField(max_length=50)),
+        db_persist=True,
+        verbose_name="Размеры",
+    )
+    colors = models.GeneratedField(
+        expression=_csv_array('available_colors', Lower),
+        output_field=ArrayField(models.CharField(max_length=200)),
+        db_persist=True,
+        verbose_name="Цвета",
+    )
+    # Скидка в процентах (как discount_percentage) - для фильтра и сортировки в БД
+    discount = models.GeneratedField(
+        expression=models.Case(
+            models.When(
+                old_price__gt=models.F('price'),
+                then=Cast(
+                    Floor((models.F('old_price') - models.F('price')) * 100 / models.F('old_price')),
+                    models.SmallIntegerField(),
+                ),
+            ),
+            default=models.Value(0),
+        ),
+        output_field=models.SmallIntegerField(),
+        db_persist=True,
+        verbose_name="Скидка, %",
+    )
+    # Рейтинг: обновляется при изменении одобренных отзывов (см. shop/ratings.py)
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, verbose_name="Средняя оценка")
+    review_count = models.PositiveIntegerField(default=0, verbose_name="Количество отзывов")
+    rating_count_1 = models.PositiveIntegerField(default=0, verbose_name="Оценок 1")
+    rating_count_2 = models.PositiveIntegerField(default=0, verbose_name="Оценок 2")
+    rating_count_3 = models.PositiveIntegerField(default=0, verbose_name="Оценок 3")
+    rating_count_4 = models.PositiveIntegerField(default=0, verbose_name="Оценок 4")
+    rating_count_5 = models.PositiveIntegerField(default=0, verbose_name="Оценок 5")
+    # Когда похожие товары были посчитаны (см. команду compute_related_products)
+    related_computed_at = models.DateTimeField(blank=True, null=True, editable=False, verbose_name="Похожие товары посчитаны")
+    # Поиск: поддерживается самой БД при каждой записи строки
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('name', config='russian', weight='A')
+            + SearchVector('name', config='english', weight='A')
+            + SearchVector('search_name', config='simple', weight='A')
+            + SearchVector('description', config='russian', weight='B')
+            + SearchVector('description', config='english', weight='B')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name="Поисковый вектор",
+    )
     # Метаданные
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='shop_product_search_gin'),
+            # Автодополнение: подстроки (pg_trgm) и префиксы нормализованного названия
+            GinIndex(OpClass('search_name', name='gin_trgm_ops'), name='shop_product_search_trgm'),
+            models.Index(OpClass('search_name', name='varchar_pattern_ops'), name='shop_product_search_prefix'),
+            GinIndex(fields=['sizes'], name='shop_product_sizes_gin'),
+            GinIndex(fields=['colors'], name='shop_product_colors_gin'),
+            # Каталог: фильтр (без фильтра / категория / пол / категория и пол) + ключ сортировки.
+            # Сортировки price и -price используют один индекс (обратный проход)
+            models.Index(fields=['name', 'id'], name='shop_product_name_idx'),
+            models.Index(fields=['price', 'id'], name='shop_product_price_idx'),
+            models.Index(fields=['-created_at', '-id'], name='shop_product_newest_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='shop_product_cat_name_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='shop_product_cat_price_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='shop_product_cat_newest_idx'),
+            models.Index(fields=['gender', 'name', 'id'], name='shop_product_gen_name_idx'),
+            models.Index(fields=['gender', 'price', 'id'], name='shop_product_gen_price_idx'),
+            models.Index(fields=['gender', '-created_at', '-id'], name='shop_product_gen_newest_idx'),
+            models.Index(fields=['category', 'gender', 'name', 'id'], name='shop_product_cat_gen_name_idx'),
+            models.Index(fields=['category', 'gender', 'price', 'id'], name='shop_product_cat_gen_price_idx'),
+            models.Index(fields=['category', 'gender', '-created_at', '-id'], name='shop_product_cat_gen_new_idx'),
+            models.Index(fields=['-avg_rating', '-id'], name='shop_product_rating_idx'),
+            models.Index(fields=['category', '-avg_rating', '-id'], name='shop_product_cat_rating_idx'),
+            models.Index(fields=['gender', '-avg_rating', '-id'], name='shop_product_gen_rating_idx'),
+            models.Index(fields=['category', 'gender', '-avg_rating', '-id'], name='shop_product_cat_gen_rate_idx'),
+            models.Index(fields=['-discount', '-id'], name='shop_product_discount_idx'),
+            models.Index(fields=['category', '-discount', '-id'], name='shop_product_cat_discount_idx'),
+            models.Index(fields=['gender', '-discount', '-id'], name='shop_product_gen_discount_idx'),
+            models.Index(fields=['category', 'gender', '-discount', '-id'], name='shop_product_cat_gen_disc_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -72,7 +203,12 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        self.search_name = normalize_search_text(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_name'}
         super().save(*args, **kwargs)
+        SearchWord.add_from(self.search_name)
 
     @property
     def discount_percentage(self):
@@ -81,15 +217,24 @@ class Product(models.Model):
             return int(((self.old_price - self.price) / self.old_price) * 100)
         return 0
 
+    @property
+    def rating_histogram(self):
+        """Гистограмма оценок: [(оценка, количество, доля в процентах)] от 5 до 1"""
+        counts = [(stars, getattr(self, f'rating_count_{stars}')) for stars in range(5, 0, -1)]
+        return [
+            (stars, count, round(count * 100 / self.review_count) if self.review_count else 0)
+            for stars, count in counts
+        ]
+
     @property
     def available_sizes_list(self):
-        """Возвращает список доступных размеров"""
-        return [size.strip() for size in self.available_sizes.split(',')]
+        """Возвращает список доступных размеров (как введены; для фильтров - sizes)"""
+        return [size.strip() for size in self.available_sizes.split(',') if size.strip()]
 
     @property
     def available_colors_list(self):
-        """Возвращает список доступных цветов"""
-        return [color.strip() for color in self.available_colors.split(',')]
+        """Возвращает список доступных цветов (как введены; для фильтров - colors)"""
+        return [color.strip() for color in self.available_colors.split(',') if color.strip()]
 
 
 class ProductImage(models.Model):
@@ -109,6 +254,89 @@ class ProductImage(models.Model):
         return f"{self.product.name} - Изображение {self.order}"
 
 
+class RelatedProduct(models.Model):
+    """Модель связи с похожим товаром (предрасчитанный ранжированный список)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links', verbose_name="Товар")
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_from', verbose_name="Похожий товар")
+    rank = models.PositiveSmallIntegerField(verbose_name="Позиция")
+    score = models.FloatField(verbose_name="Оценка сходства")
+
+    class Meta:
+        verbose_name = "Похожий товар"
+        verbose_name_plural = "Похожие товары"
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='shop_related_unique_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class ProductVariant(models.Model):
+    """Модель варианта товара (размер и цвет) с остатком на складе"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants', verbose_name="Товар")
+    sku = models.CharField(max_length=64, unique=True, verbose_name="Артикул")
+    size = models.CharField(max_length=50, verbose_name="Размер")
+    color = models.CharField(max_length=200, verbose_name="Цвет")
+    stock = models.PositiveIntegerField(default=0, verbose_name="Остаток")
+
+    class Meta:
+        verbose_name = "Вариант товара"
+        verbose_name_plural = "Варианты товаров"
+        ordering = ['size', 'color']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'size', 'color'], name='shop_variant_unique_option'),
+        ]
+        indexes = [
+            # Фильтр каталога "в наличии": только варианты с остатком
+            models.Index(fields=['product'], condition=models.Q(stock__gt=0), name='shop_variant_in_stock_idx'),
+            models.Index(
+                fields=['size', 'product'], condition=models.Q(stock__gt=0), name='shop_variant_size_stock_idx'
+            ),
+            models.Index(
+                fields=['color', 'product'], condition=models.Q(stock__gt=0), name='shop_variant_color_stock_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} - {self.size} / {self.color}"
+
+    def save(self, *args, **kwargs):
+        self.normalize()
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        # Ограничение (product, size, color) проверяется уже по приведенным значениям
+        self.normalize()
+
+    def normalize(self):
+        """Приводит размер и цвет к виду Product.sizes / Product.colors"""
+        self.size = self.normalize_size(self.size)
+        self.color = self.normalize_color(self.color)
+
+    @staticmethod
+    def normalize_size(size):
+        return size.strip().upper()
+
+    @staticmethod
+    def normalize_color(color):
+        return color.strip().lower()
+
+    @classmethod
+    def decrement_stock(cls, pk, quantity=1):
+        """Атомарно списывает quantity единиц; False, если остатка не хватает.
+
+        Проверка и списание - один UPDATE с условием на остаток, поэтому
+        параллельные покупки не уводят остаток в минус.
+        """
+        updated = cls.objects.filter(pk=pk, stock__gte=quantity).update(stock=models.F('stock') - quantity)
+        if updated and not cls.objects.filter(pk=pk, stock__gt=0).exists():
+            # Вариант закончился: выдача "в наличии" и её счётчики устарели
+            bump_catalog_version()
+        return updated == 1
+
+
 class Review(models.Model):
     """Модель отзыва о товаре"""
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews', verbose_name="Товар")
@@ -126,6 +354,14 @@ class Review(models.Model):
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
         ordering = ['-created_at']
+        indexes = [
+            # Страницы одобренных отзывов товара (курсорная пагинация)
+            models.Index(
+                fields=['product', '-created_at', '-id'],
+                condition=models.Q(is_approved=True),
+                name='shop_review_product_page_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.user.username} ({self.rating}/5)"
@@ -140,9 +376,53 @@ class Contact(models.Model):
     working_hours = models.CharField(max_length=200, verbose_name="Часы работы")
     is_active = models.BooleanField(default=True, verbose_name="Активен")
 
+    objects = CachingQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Контакт"
         verbose_name_plural = "Контакты"
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class SearchWord(models.Model):
+    """Словарь слов нормализованных названий товаров (исправление опечаток в поиске)"""
+    MIN_LENGTH = 3
+
+    word = models.CharField(max_length=100, unique=True, verbose_name="Слово")
+
+    class Meta:
+        verbose_name = "Поисковое слово"
+        verbose_name_plural = "Поисковые слова"
+        indexes = [
+            GinIndex(OpClass('word', name='gin_trgm_ops'), name='shop_searchword_trgm'),
+        ]
+
+    def __str__(self):
+        return self.word
+
+    @classmethod
+    def extract(cls, search_name):
+        """Возвращает множество слов нормализованной строки, пригодных для словаря"""
+        return {
+            word for word in search_name.split()
+            if cls.MIN_LENGTH <= len(word) <= 100 and not word.isdigit()
+        }
+
+    @classmethod
+    def add_from(cls, *search_names):
+        """Добавляет в словарь слова из нормализованных строк"""
+        words = set().union(*(cls.extract(search_name) for search_name in search_names))
+        cls.objects.bulk_create([cls(word=word) for word in words], ignore_conflicts=True)
+
+    @classmethod
+    def rebuild(cls):
+        """Пересобирает словарь по всем названиям товаров"""
+        words = set()
+        for search_name in Product.objects.values_list('search_name', flat=True).iterator():
+            words |= cls.extract(search_name)
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create([cls(word=word) for word in words], batch_size=5000)
+        return len(words)
@@ -0,0 +1,88 @@
+"""Кэш целых страниц для анонимных посетителей.
+
+Ключ страницы содержит версию каталога (её сбрасывают сигналы товаров,
+категорий, изображений и контактов), путь и признак HX-Request. Ответ из
+кэша отдаётся без обращений к ORM: версия каталога хранится в кэше.
+Страницы с сессией, с параметрами запроса или с CSRF-токеном не кэшируются.
+
+Включается настройкой SHOP_PAGE_CACHE и требует общего кэша процессов:
+с LocMemCache воркер, не видевший изменения, отдавал бы устаревшую
+страницу до истечения PAGE_CACHE_TIMEOUT.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .cache import get_catalog_version, is_shared_cache, record_stats
+
+
+PAGE_CACHE_TIMEOUT = 60 * 15
+PAGE_STATS = ('hits', 'misses', 'bypass')
+
+
+def is_enabled():
+    return getattr(settings, 'SHOP_PAGE_CACHE', False)
+
+
+def check_page_cache():
+    """ImproperlyConfigured, если кэш страниц включён без общего кэша процессов"""
+    if is_enabled() and not is_shared_cache():
+        raise ImproperlyConfigured(
+            'SHOP_PAGE_CACHE требует общего кэша процессов (Redis или Memcached): задайте SHOP_CACHE_URL'
+        )
+
+
+def page_key(request):
+    hx = 'hx' if request.headers.get('HX-Request') else 'full'
+    return f'shop:page:{get_catalog_version()}:{hx}:{request.path}'
+
+
+def _cacheable_request(request):
+    # С сессией страница может зависеть от пользователя; параметры - это фильтры
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.GET
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def _cacheable_response(request, response):
+    # Токен CSRF в разметке принадлежит одному посетителю
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def versioned_page(view):
+    """Кэширует ответ представления до следующего изменения каталога"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_enabled():
+            return view(request, *args, **kwargs)
+        if not _cacheable_request(request):
+            record_stats('pages', bypass=1)
+            return view(request, *args, **kwargs)
+
+        key = page_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            record_stats('pages', hits=1)
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Page-Cache'] = 'hit'
+        else:
+            record_stats('pages', misses=1)
+            response = view(request, *args, **kwargs)
+            if _cacheable_response(request, response):
+                cache.set(key, (response.content, response['Content-Type']), PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        patch_vary_headers(response, ('HX-Request', 'Cookie'))
+        return response
+    return wrapper
@@ -0,0 +1,237 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .cache import get_catalog_version, get_or_compute
+
+
+# Порядок выдачи каталога для каждого значения параметра sort.
+# Последнее поле - id, чтобы порядок был однозначным
+SORT_ORDERS = {
+    'name': ('name', 'id'),
+    'price-low': ('price', 'id'),
+    'price-high': ('-price', '-id'),
+    'newest': ('-created_at', '-id'),
+    'rating': ('-avg_rating', '-id'),
+    'discount': ('-discount', '-id'),
+}
+DEFAULT_SORT = 'name'
+
+# Все порядки, по которым возможна курсорная пагинация (каталог и отзывы)
+KEYSET_ORDERS = {
+    **SORT_ORDERS,
+    'reviews': ('-created_at', '-id'),
+}
+
+# Начиная с этой оценки планировщика точный COUNT(*) не выполняется
+BROAD_COUNT_THRESHOLD = 1000
+COUNT_CACHE_TIMEOUT = 60 * 15
+
+
+def _field_name(order):
+    return order.lstrip('-')
+
+
+def encode_cursor(sort_by, values):
+    """Кодирует значения ключа сортировки последнего товара в непрозрачную строку"""
+    payload = json.dumps({'s': sort_by, 'v': [str(value) for value in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _sort_field(model, order):
+    field = model._meta.get_field(_field_name(order))
+    # У GeneratedField тип значения задаёт output_field
+    return getattr(field, 'output_field', field)
+
+
+def decode_cursor(model, sort_by, cursor):
+    """Возвращает значения ключа сортировки из курсора или None, если курсор не подходит"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        orders = KEYSET_ORDERS[sort_by]
+        if payload['s'] != sort_by or len(payload['v']) != len(orders):
+            return None
+        return [
+            _sort_field(model, order).to_python(value)
+            for order, value in zip(orders, payload['v'])
+        ]
+    except (ValueError, TypeError, KeyError, binascii.Error, ValidationError):
+        return None
+
+
+def cursor_after(sort_by, obj):
+    """Курсор страницы, которая начинается сразу после объекта obj в порядке sort_by"""
+    values = [getattr(obj, _field_name(order)) for order in KEYSET_ORDERS[sort_by]]
+    return encode_cursor(sort_by, values)
+
+
+def _after(orders, values):
+    """Условие "строго после ключа" для сортировки orders.
+
+    Для ключа (a, id) строится a >= x AND (a > x OR id > y): первое условие
+    становится границей индексного сканирования, поэтому стоимость страницы
+    не зависит от её глубины.
+    """
+    (order, value), (tie_order, tie_value) = zip(orders, values)
+    field, tie_field = _field_name(order), _field_name(tie_order)
+    bound = 'lte' if order.startswith('-') else 'gte'
+    strict = 'lt' if order.startswith('-') else 'gt'
+    tie_strict = 'lt' if tie_order.startswith('-') else 'gt'
+    return Q(**{f'{field}__{bound}': value}) & (
+        Q(**{f'{field}__{strict}': value}) | Q(**{f'{tie_field}__{tie_strict}': tie_value})
+    )
+
+
+class KeysetPage:
+    """Страница курсорной пагинации"""
+
+    def __init__(self, object_list, sort_by, has_next):
+        self.object_list = object_list
+        self.sort_by = sort_by
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return cursor_after(self.sort_by, self.object_list[-1])
+
+
+def paginate_keyset(queryset, sort_by, cursor, per_page):
+    """Возвращает страницу после курсора (или первую страницу).
+
+    Вместо OFFSET/LIMIT и COUNT(*) выбирается per_page + 1 строк после
+    ключа последнего товара предыдущей страницы.
+    """
+    if sort_by not in KEYSET_ORDERS:
+        sort_by = DEFAULT_SORT
+    orders = KEYSET_ORDERS[sort_by]
+    queryset = queryset.order_by(*orders)
+
+    values = decode_cursor(queryset.model, sort_by, cursor) if cursor else None
+    if values is not None:
+        queryset = queryset.filter(_after(orders, values))
+
+    rows = list(queryset[:per_page + 1])
+    return KeysetPage(rows[:per_page], sort_by, has_next=len(rows) > per_page)
+
+
+def estimate_count(queryset):
+    """Оценка числа строк из плана запроса (EXPLAIN без выполнения)"""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_products(queryset, filter_key=None, estimate=True):
+    """Число товаров для набора фильтров: (количество, является ли оно оценкой).
+
+    Результат кэшируется по filter_key (по умолчанию - по тексту запроса)
+    до следующего изменения каталога (прежнее число отдается, пока новое
+    считается в фоне). Для широких фильтров вместо COUNT(*) берётся оценка
+    планировщика Postgres; estimate=False отключает её для фильтров, где
+    оценка бессмысленна (полнотекстовый поиск, массивы, EXISTS).
+    """
+    queryset = queryset.order_by()
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # Условие заведомо ложно (например, поиск без слов): запросов не нужно
+        return (0, False)
+    if filter_key is None:
+        filter_key = hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+    key = f'shop:count:{filter_key}'
+
+    def count():
+        if estimate:
+            rows = estimate_count(queryset)
+            if rows >= BROAD_COUNT_THRESHOLD:
+                return (rows, True)
+        return (queryset.count(), False)
+
+    return get_or_compute(key, count, COUNT_CACHE_TIMEOUT, version=get_catalog_version())
+
+
+class CountingPaginator(Paginator):
+    """Paginator, который берёт число товаров из count_products.
+
+    Оценка планировщика только показывается (display_count, "≈N"): страница
+    тогда выбирается с одной лишней строкой, по ней определяется, есть ли
+    следующая, а count и num_pages считаются по уже выбранным строкам.
+    """
+
+    def __init__(self, object_list, per_page, filter_key=None, estimate=True, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.filter_key = filter_key
+        self.estimate = estimate
+
+    @cached_property
+    def _counted(self):
+        return count_products(self.object_list, self.filter_key, self.estimate)
+
+    @property
+    def display_count(self):
+        return self._counted[0]
+
+    @property
+    def count_is_estimate(self):
+        return self._counted[1]
+
+    @cached_property
+    def count(self):
+        if self.count_is_estimate:
+            return self.object_list.count()
+        return self._counted[0]
+
+    def validate_number(self, number):
+        if not self.count_is_estimate or 'count' in self.__dict__:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        if not self.count_is_estimate or 'count' in self.__dict__:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        self.__dict__['count'] = bottom + len(rows)
+        return self._get_page(rows[:self.per_page], number, self)
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # Номер за последней страницей: её ищем уже по точному числу
+            return self.page(self.num_pages)
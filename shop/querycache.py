@@ -0,0 +1,145 @@
+"""Кэш результатов запросов ORM с инвалидацией по таблицам.
+
+Запрос включается явно: Product.objects.cards().cached(). Ключ - текст
+SQL, параметры и версии всех таблиц запроса (FROM и JOIN, включая
+подзапросы). Любая запись в таблицу магазина (save, delete, update(),
+bulk_create, сырой SQL, действия админки) меняет версию таблицы:
+перехватчик запросов соединения видит INSERT, UPDATE и DELETE независимо
+от того, каким путем они выполнены. Версия меняется сразу и ещё раз после
+фиксации транзакции, чтобы результат, закэшированный другим процессом до
+фиксации, не пережил её.
+
+Версии ведутся только для таблиц магазина: запрос, затрагивающий другие
+таблицы (например, auth_user), выполняется без кэша. Без кэша выполняется
+и запрос к таблице, в которую текущая транзакция уже писала: он видит
+незафиксированные строки, которые могут быть откачены.
+
+Попадания считаются по отпечатку запроса (хэш SQL без параметров).
+"""
+import hashlib
+import re
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, transaction
+
+from .cache import bump_version, get_version, record_stats
+
+
+QUERY_CACHE_TIMEOUT = 60 * 5
+QUERY_STATS = ('hits', 'misses', 'bypass')
+FINGERPRINTS_KEY = 'shop:query-fingerprints'
+
+TABLES_RE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?', re.IGNORECASE)
+# Сырой SQL обычно пишет имя таблицы без кавычек
+WRITE_RE = re.compile(r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)"?', re.IGNORECASE)
+
+_shop_tables = None
+_model_tables = None
+
+
+def table_version_key(table):
+    return f'shop:table-version:{table}'
+
+
+def shop_tables():
+    global _shop_tables
+    if _shop_tables is None:
+        _shop_tables = frozenset(model._meta.db_table for model in apps.get_app_config('shop').get_models())
+    return _shop_tables
+
+
+def model_tables():
+    global _model_tables
+    if _model_tables is None:
+        _model_tables = frozenset(model._meta.db_table for model in apps.get_models(include_auto_created=True))
+    return _model_tables
+
+
+def _written_tables(connection):
+    """Таблицы магазина, в которые писала текущая транзакция соединения"""
+    # Вне транзакции записи уже зафиксированы (или откачены)
+    if not connection.in_atomic_block or not hasattr(connection, 'shop_written_tables'):
+        connection.shop_written_tables = set()
+    return connection.shop_written_tables
+
+
+def record_write(execute, sql, params, many, context):
+    """Перехватчик запросов соединения: меняет версию таблицы магазина после записи в неё"""
+    result = execute(sql, params, many, context)
+    match = WRITE_RE.match(sql)
+    if match and match.group(1) in shop_tables():
+        connection = context['connection']
+        key = table_version_key(match.group(1))
+        bump_version(key)
+        if connection.in_atomic_block:
+            _written_tables(connection).add(match.group(1))
+        transaction.on_commit(lambda: bump_version(key), using=connection.alias)
+    return result
+
+
+def fingerprint(sql):
+    return hashlib.md5(sql.encode()).hexdigest()[:12]
+
+
+def _remember_fingerprint(fp, sql):
+    fingerprints = cache.get(FINGERPRINTS_KEY) or {}
+    if fp not in fingerprints:
+        fingerprints[fp] = sql
+        cache.set(FINGERPRINTS_KEY, fingerprints, timeout=None)
+
+
+def query_fingerprints():
+    """{отпечаток: SQL} запросов, которые проходили через кэш"""
+    return cache.get(FINGERPRINTS_KEY) or {}
+
+
+class CachingQuerySet(models.QuerySet):
+    """QuerySet, результат которого можно кэшировать методом cached()"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_timeout = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_timeout = self._cache_timeout
+        return clone
+
+    def cached(self, timeout=QUERY_CACHE_TIMEOUT):
+        """Результат запроса берется из кэша до записи в любую из его таблиц"""
+        clone = self._chain()
+        clone._cache_timeout = timeout
+        return clone
+
+    def _fetch_all(self):
+        if self._cache_timeout is None or self._result_cache is not None:
+            return super()._fetch_all()
+        try:
+            sql, params = self.query.sql_with_params()
+        except EmptyResultSet:
+            return super()._fetch_all()
+
+        fp = fingerprint(sql)
+        tables = sorted(set(TABLES_RE.findall(sql)) & model_tables())
+        if not shop_tables().issuperset(tables) or _written_tables(connections[self.db]).intersection(tables):
+            record_stats(f'query:{fp}', bypass=1)
+            _remember_fingerprint(fp, sql)
+            return super()._fetch_all()
+        versions = [get_version(table_version_key(table)) for table in tables]
+        key = 'shop:query:' + hashlib.md5(
+            repr((self.db, sql, params, versions, self._iterable_class.__name__)).encode()
+        ).hexdigest()
+
+        rows = cache.get(key)
+        if rows is None:
+            record_stats(f'query:{fp}', misses=1)
+            _remember_fingerprint(fp, sql)
+            super()._fetch_all()
+            cache.set(key, self._result_cache, self._cache_timeout)
+        else:
+            record_stats(f'query:{fp}', hits=1)
+            self._result_cache = rows
+            if self._prefetch_related_lookups and not self._prefetch_done:
+                self._prefetch_related_objects()
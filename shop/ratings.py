@@ -0,0 +1,86 @@
+"""Рейтинг товаров, хранящийся в самой строке Product.
+
+avg_rating, review_count и гистограмма rating_count_1..5 учитывают
+только одобренные отзывы. При создании, одобрении, снятии одобрения и
+удалении отзыва счётчики меняются одним UPDATE без пересчёта всех
+отзывов; recompute_ratings пересчитывает их целиком и сам сбрасывает
+кэши исправленных товаров.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Count, DecimalField, F, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+from .cache import bump_catalog_version, bump_version, reviews_version_key
+from .catalog import evict_product_ids
+from .invalidation import is_enabled as invalidation_bus_enabled, publish
+from .models import Product, Review
+
+
+RATINGS = range(1, 6)
+
+
+def rating_field(rating):
+    return f'rating_count_{rating}'
+
+
+def apply_review(product_id, rating, delta):
+    """Добавляет (delta=1) или убирает (delta=-1) одобренную оценку товара"""
+    # В UPDATE правые части видят старые значения строки, поэтому среднее
+    # считается из старых счётчиков с поправкой на delta
+    total = sum(stars * F(rating_field(stars)) for stars in RATINGS) + Value(delta * rating)
+    count = F('review_count') + Value(delta)
+    average = Cast(total, DecimalField(max_digits=12, decimal_places=4)) / NullIf(count, Value(0))
+    Product.objects.filter(pk=product_id).update(**{
+        rating_field(rating): F(rating_field(rating)) + Value(delta),
+        'review_count': count,
+        'avg_rating': Coalesce(Round(average, 2), Value(0), output_field=DecimalField(max_digits=3, decimal_places=2)),
+    })
+
+
+def recompute_ratings(batch_size=1000):
+    """Пересчитывает рейтинги всех товаров по отзывам; возвращает число исправленных товаров"""
+    histograms = {}
+    counts = (
+        Review.objects.filter(is_approved=True)
+        .values_list('product_id', 'rating')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for product_id, rating, count in counts:
+        if rating in RATINGS:
+            histograms.setdefault(product_id, dict.fromkeys(RATINGS, 0))[rating] = count
+
+    fields = ['avg_rating', 'review_count', *(rating_field(stars) for stars in RATINGS)]
+    changed = []
+    for product in Product.objects.only(*fields).iterator(chunk_size=batch_size):
+        histogram = histograms.get(product.pk, dict.fromkeys(RATINGS, 0))
+        review_count = sum(histogram.values())
+        total = sum(stars * count for stars, count in histogram.items())
+        values = {
+            'review_count': review_count,
+            'avg_rating': (
+                (Decimal(total) / review_count).quantize(Decimal('0.01'), ROUND_HALF_UP)
+                if review_count else Decimal(0)
+            ),
+            **{rating_field(stars): count for stars, count in histogram.items()},
+        }
+        if any(getattr(product, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(product, field, value)
+            changed.append(product)
+
+    Product.objects.bulk_update(changed, fields, batch_size=batch_size)
+    if changed:
+        # bulk_update не вызывает post_save: фрагменты рейтинга, сортировка по рейтингу и шина
+        for product in changed:
+            bump_version(reviews_version_key(product.pk))
+            if invalidation_bus_enabled():
+                publish(product)
+        for category_id, gender in (
+            Product.objects.filter(pk__in=[product.pk for product in changed])
+            .values_list('category_id', 'gender').distinct()
+        ):
+            evict_product_ids([category_id], [gender])
+        bump_catalog_version()
+    return len(changed)
@@ -0,0 +1,46 @@
+"""Справочные данные, нужные почти каждой странице: активные категории и контакты.
+
+Они меняются редко, поэтому хранятся в памяти процесса (LocalCache) поверх
+общего кэша. Сигналы категорий и контактов меняют версию REFERENCE_VERSION_KEY.
+"""
+from .cache import LocalCache
+from .invalidation import subscribe
+from .models import Category, Contact
+
+
+REFERENCE_VERSION_KEY = 'shop:reference-version'
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+
+reference_cache = LocalCache('reference', REFERENCE_VERSION_KEY)
+
+
+def _evict_reference(model_label, pk):
+    reference_cache.clear()
+
+
+# Изменения в других процессах приходят по шине, не дожидаясь проверки версии
+subscribe('shop.category', _evict_reference)
+subscribe('shop.contact', _evict_reference)
+
+
+def active_categories():
+    """Активные категории (список, общий для всех запросов процесса - не изменять)"""
+    return reference_cache.get_or_set(
+        'shop:reference:categories',
+        lambda: list(Category.objects.filter(is_active=True)),
+        REFERENCE_CACHE_TIMEOUT,
+    )
+
+
+def active_category(slug):
+    """Активная категория по slug или None"""
+    return next((category for category in active_categories() if category.slug == slug), None)
+
+
+def active_contact():
+    """Первый активный контакт или None"""
+    return reference_cache.get_or_set(
+        'shop:reference:contact',
+        lambda: Contact.objects.filter(is_active=True).first(),
+        REFERENCE_CACHE_TIMEOUT,
+    )
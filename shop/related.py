@@ -0,0 +1,256 @@
+"""Предрасчёт похожих товаров.
+
+Кандидаты - товары той же категории. Оценка складывается из косинусного
+сходства TF-IDF названий и описаний, совпадения пола и близости цены.
+TF-IDF хранится разреженно, а сходство считается блоками NumPy отдельно
+для каждой категории, поэтому память растёт линейно с её размером;
+категории распределяются по процессам. При частичном пересчёте
+обновляются и списки товаров, в которые могут войти новые и
+изменённые товары.
+
+Нужен NumPy.
+"""
+import math
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Product, RelatedProduct
+from .text import normalize_search_text
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+RELATED_LIMIT = 8
+MAX_FEATURES = 2048
+# Название важнее описания: его слова учитываются несколько раз
+NAME_WEIGHT = 3
+
+TEXT_WEIGHT = 0.6
+GENDER_WEIGHT = 0.25
+PRICE_WEIGHT = 0.15
+# Цена, отличающаяся в PRICE_RANGE раз и больше, не добавляет сходства
+PRICE_RANGE = 4
+
+# Размер блока строк при попарном сравнении
+CHUNK = 512
+
+
+def _tokens(name, description):
+    return normalize_search_text(name).split() * NAME_WEIGHT + normalize_search_text(description).split()
+
+
+class SparseRows:
+    """Строки разреженной матрицы (CSR): память пропорциональна числу ненулевых значений"""
+
+    def __init__(self, indptr, indices, data, width):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.width = width
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def dense(self, rows):
+        """Плотная матрица строк rows (len(rows) x width)"""
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = ends - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        matrix = np.zeros((len(rows), self.width), dtype=np.float32)
+        matrix[np.repeat(np.arange(len(rows)), lengths), self.indices[positions]] = self.data[positions]
+        return matrix
+
+
+def tfidf_matrix(documents, max_features=MAX_FEATURES):
+    """Нормированная разреженная матрица TF-IDF (документы x самые частые термы)"""
+    frequencies = Counter()
+    for tokens in documents:
+        frequencies.update(set(tokens))
+    vocabulary = {term: index for index, (term, _) in enumerate(frequencies.most_common(max_features))}
+    document_frequency = np.array([frequencies[term] for term in vocabulary], dtype=np.float32)
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+
+    indptr, indices, data = [0], [], []
+    for tokens in documents:
+        counts = Counter(vocabulary[token] for token in tokens if token in vocabulary)
+        columns = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts))) * idf[columns]
+        norm = np.linalg.norm(weights)
+        indices.append(columns)
+        data.append(weights / norm if norm > 0 else weights)
+        indptr.append(indptr[-1] + len(columns))
+    return SparseRows(
+        np.array(indptr, dtype=np.int64),
+        np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+        np.concatenate(data).astype(np.float32) if data else np.empty(0, dtype=np.float32),
+        len(vocabulary),
+    )
+
+
+def pair_scores(left, right, left_vectors, right_vectors, genders, log_prices):
+    """Сходство строк left со строками right (len(left) x len(right)); сам с собой - -inf"""
+    scores = TEXT_WEIGHT * (left_vectors @ right_vectors.T)
+    scores += GENDER_WEIGHT * (genders[left, None] == genders[None, right])
+    price_distance = np.abs(log_prices[left, None] - log_prices[None, right]) / math.log(PRICE_RANGE)
+    scores += PRICE_WEIGHT * np.clip(1 - price_distance, 0, 1)
+    scores[left[:, None] == right[None, :]] = -np.inf
+    return scores
+
+
+def _chunks(count):
+    for start in range(0, count, CHUNK):
+        yield np.arange(start, min(start + CHUNK, count))
+
+
+def score_block(ids, vectors, genders, prices, targets, limit=RELATED_LIMIT):
+    """Похожие товары для строк targets одной категории: {id: [(related_id, score)]}.
+
+    Сходство считается блоками CHUNK x CHUNK, а для каждой строки хранятся
+    только limit лучших кандидатов.
+    """
+    log_prices = np.log(np.maximum(prices, 1))
+    targets = np.asarray(targets, dtype=np.int64)
+    count = min(limit, len(ids) - 1)
+    if count <= 0:
+        return {int(ids[row]): [] for row in targets}
+
+    result = {}
+    for start in range(0, len(targets), CHUNK):
+        rows = targets[start:start + CHUNK]
+        row_vectors = vectors.dense(rows)
+        best_scores = np.empty((len(rows), 0), dtype=np.float64)
+        best_columns = np.empty((len(rows), 0), dtype=np.int64)
+        for columns in _chunks(len(ids)):
+            scores = pair_scores(rows, columns, row_vectors, vectors.dense(columns), genders, log_prices)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_columns = np.concatenate([best_columns, np.broadcast_to(columns, scores.shape)], axis=1)
+            if best_scores.shape[1] > count:
+                keep = np.argpartition(-best_scores, count - 1, axis=1)[:, :count]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_columns = np.take_along_axis(best_columns, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_columns = np.take_along_axis(best_columns, order, axis=1)
+        for offset, row in enumerate(rows):
+            result[int(ids[row])] = [
+                (int(ids[column]), float(score)) for column, score in zip(best_columns[offset], best_scores[offset])
+            ]
+    return result
+
+
+def expand_targets(vectors, genders, prices, targets, thresholds):
+    """Добавляет к targets строки, в список которых может войти один из targets.
+
+    Сходство симметрично, поэтому хватает сравнить все строки с targets:
+    строка пересчитывается, если её сходство с одним из них выше худшего
+    в её списке (thresholds; -inf - список неполный).
+    """
+    log_prices = np.log(np.maximum(prices, 1))
+    targets = np.asarray(targets, dtype=np.int64)
+    target_vectors = vectors.dense(targets)
+    expanded = [targets]
+    for rows in _chunks(len(vectors)):
+        scores = pair_scores(rows, targets, vectors.dense(rows), target_vectors, genders, log_prices)
+        expanded.append(rows[scores.max(axis=1) > thresholds[rows]])
+    return np.unique(np.concatenate(expanded))
+
+
+def _score_category(task):
+    # TF-IDF строится по блоку категории: память ограничена размером категории
+    ids, texts, genders, prices, targets, thresholds, limit = task
+    vectors = tfidf_matrix([_tokens(name, description) for name, description in texts])
+    if thresholds is not None:
+        targets = expand_targets(vectors, genders, prices, targets, thresholds)
+    return score_block(ids, vectors, genders, prices, targets, limit)
+
+
+def current_thresholds(categories, limit):
+    """Худшая оценка в сохранённом списке каждого товара категорий; неполные списки не попадают"""
+    return dict(
+        RelatedProduct.objects.filter(product__category_id__in=categories)
+        .values('product_id')
+        .annotate(count=Count('id'), worst=Min('score'))
+        .filter(count__gte=limit)
+        .values_list('product_id', 'worst')
+    )
+
+
+def changed_products():
+    """id товаров, изменённых после последнего расчёта, и товаров, ссылающихся на них"""
+    changed = set(
+        Product.objects.filter(
+            Q(related_computed_at__isnull=True) | Q(updated_at__gt=F('related_computed_at'))
+        ).values_list('id', flat=True)
+    )
+    linked = RelatedProduct.objects.filter(related_id__in=changed).values_list('product_id', flat=True)
+    return changed | set(linked)
+
+
+def compute_related(product_ids=None, workers=1, limit=RELATED_LIMIT):
+    """Пересчитывает похожие товары для product_ids (всех, если None); возвращает число товаров"""
+    started = timezone.now()
+    targets = Product.objects.all()
+    if product_ids is not None:
+        targets = targets.filter(pk__in=product_ids)
+    categories = set(targets.values_list('category_id', flat=True))
+
+    products = list(
+        Product.objects.filter(category_id__in=categories)
+        .order_by('category_id', 'id')
+        .values_list('id', 'category_id', 'gender', 'price', 'name', 'description')
+    )
+    if not products:
+        return 0
+    ids = np.array([row[0] for row in products], dtype=np.int64)
+    category_ids = np.array([row[1] for row in products], dtype=np.int64)
+    gender_codes = {code: index for index, (code, _) in enumerate(Product.GENDER_CHOICES)}
+    genders = np.array([gender_codes.get(row[2], -1) for row in products], dtype=np.int8)
+    prices = np.array([float(row[3]) for row in products], dtype=np.float64)
+    wanted = np.ones(len(ids), dtype=bool) if product_ids is None else np.isin(ids, list(product_ids))
+    thresholds = None
+    if product_ids is not None:
+        # Частичный пересчёт: новые и изменённые товары могут войти в списки других товаров
+        worst = current_thresholds(categories, limit)
+        thresholds = np.array([worst.get(int(pk), -np.inf) for pk in ids], dtype=np.float64)
+
+    tasks = []
+    for category_id in categories:
+        block = np.flatnonzero(category_ids == category_id)
+        rows = np.flatnonzero(wanted[block])
+        if len(rows):
+            texts = [products[index][4:] for index in block]
+            block_thresholds = None if thresholds is None else thresholds[block]
+            tasks.append((ids[block], texts, genders[block], prices[block], rows, block_thresholds, limit))
+
+    related = {}
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for block_result in executor.map(_score_category, tasks):
+                related.update(block_result)
+    else:
+        for task in tasks:
+            related.update(_score_category(task))
+
+    with transaction.atomic():
+        existing = RelatedProduct.objects.all()
+        if product_ids is not None:
+            existing = existing.filter(product_id__in=related)
+        existing.delete()
+        RelatedProduct.objects.bulk_create(
+            [
+                RelatedProduct(product_id=product_id, related_id=related_id, rank=rank, score=score)
+                for product_id, items in related.items()
+                for rank, (related_id, score) in enumerate(items)
+            ],
+            batch_size=5000,
+        )
+        computed = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=related)
+        computed.update(related_computed_at=started)
+    return len(related)
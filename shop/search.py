@@ -0,0 +1,127 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, FloatField, Q, Value
+
+from .models import Category, SearchWord
+from .text import normalize_search_text
+
+
+# Словари, которыми строится Product.search_vector
+SEARCH_CONFIGS = ('russian', 'english')
+
+TERM_RE = re.compile(r'\w+')
+
+# Автодополнение
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MIN_LENGTH = 2
+# Строки короче трёх символов не дают ни одной триграммы
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _prefix_query(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def build_search_query(text):
+    """Собирает поисковый запрос из пользовательской строки.
+
+    Каждое слово ищется как префикс (поиск по мере ввода), запрос
+    выполняется сразу по русскому и английскому словарям, а также по
+    транслитерированному названию, чтобы "platye" находило "платье".
+    Возвращает None, если в строке нет ни одного слова.
+    """
+    terms = TERM_RE.findall(text.lower())
+    if not terms:
+        return None
+
+    raw_query = _prefix_query(terms)
+    query = None
+    for config in SEARCH_CONFIGS:
+        config_query = SearchQuery(raw_query, config=config, search_type='raw')
+        query = config_query if query is None else query | config_query
+
+    normalized_terms = normalize_search_text(text).split()
+    if normalized_terms:
+        query |= SearchQuery(_prefix_query(normalized_terms), config='simple', search_type='raw')
+    return query
+
+
+def search_products(queryset, text):
+    """Фильтрует товары по поисковой строке и добавляет релевантность `rank`"""
+    query = build_search_query(text)
+    if query is None:
+        return queryset.none().annotate(rank=Value(0, output_field=FloatField()))
+
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    )
+
+
+def correct_spelling(term):
+    """Исправляет опечатки по словарю слов из названий товаров.
+
+    Слова, которые встречаются в словаре хотя бы как подстрока, остаются
+    как есть, остальные заменяются ближайшим по триграммам словом.
+    Возвращает None, если для какого-то слова нет ни одного похожего.
+    """
+    corrected = []
+    for word in term.split():
+        if len(word) >= TRIGRAM_MIN_LENGTH and not SearchWord.objects.filter(word__contains=word).exists():
+            word = SearchWord.objects.filter(word__trigram_similar=word).annotate(
+                similarity=TrigramSimilarity('word', word)
+            ).order_by('-similarity', 'word').values_list('word', flat=True).first()
+            if word is None:
+                return None
+        corrected.append(word)
+    return ' '.join(corrected)
+
+
+def _autocomplete_tiers(products, term):
+    """Запросы автодополнения от лучших совпадений к худшим.
+
+    Каждый уровень идёт по своему индексу и выполняется, только если
+    предыдущие не набрали нужного количества подсказок.
+    """
+    long_term = len(term) >= TRIGRAM_MIN_LENGTH
+    # Слов, которых нет в названиях товаров, не ищем по таблице товаров вовсе
+    name_term = correct_spelling(term) if long_term else term
+    if name_term is not None:
+        # Название начинается со строки: btree-индекс shop_product_search_prefix
+        yield products.filter(search_name__startswith=name_term).order_by('search_name')
+        if long_term:
+            # Триграммный индекс shop_product_search_trgm, без сортировки,
+            # чтобы LIMIT останавливал сканирование. Совпадение с началом
+            # слова возможно, только если такое слово есть в словаре
+            first_word = name_term.split()[0]
+            if SearchWord.objects.filter(word__startswith=first_word).exists():
+                yield products.filter(search_name__contains=f' {name_term}').order_by()
+            yield products.filter(search_name__contains=name_term).order_by()
+
+    if long_term:
+        categories = Category.objects.filter(
+            Q(search_name__contains=term) | Q(search_name__trigram_similar=term),
+            is_active=True,
+        )
+        yield products.filter(category__in=categories).order_by()
+
+
+def autocomplete_products(queryset, text, limit=AUTOCOMPLETE_LIMIT):
+    """Подсказки по названию товара и категории.
+
+    Сначала идут товары, название которых начинается со строки, затем
+    совпадения с началом слова, затем любые подстроки и, наконец, товары
+    подходящих категорий. Сравниваются нормализованные названия, поэтому
+    кириллица и латиница взаимозаменяемы; опечатки исправляются по
+    словарю SearchWord.
+    """
+    term = normalize_search_text(text)
+    if len(term) < AUTOCOMPLETE_MIN_LENGTH:
+        return []
+
+    results = []
+    for tier in _autocomplete_tiers(queryset, term):
+        results += tier.exclude(pk__in=[product.pk for product in results])[:limit - len(results)]
+        if len(results) >= limit:
+            break
+    return results
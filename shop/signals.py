@@ -0,0 +1,123 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version, bump_version, images_version_key, reviews_version_key
+from .catalog import evict_product_ids
+from .models import Category, Contact, Product, ProductImage, ProductVariant, Review
+from .invalidation import is_enabled as invalidation_bus_enabled, publish
+from .querycache import record_write
+from .ratings import apply_review
+from .reference import REFERENCE_VERSION_KEY
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Contact)
+def invalidate_catalog(sender, **kwargs):
+    """Сбрасывает кэши каталога и страниц при изменении товаров, категорий и контактов"""
+    bump_catalog_version()
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_lists(sender, instance, **kwargs):
+    """Запоминает категорию и пол товара до сохранения, чтобы сбросить и прежние списки id"""
+    instance._listed_in = (
+        Product.objects.filter(pk=instance.pk).values_list('category_id', 'gender').first()
+        if instance.pk else None
+    )
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_ids(sender, instance, **kwargs):
+    """Сбрасывает только списки id, в которые входил или входит товар"""
+    category_ids, genders = {instance.category_id}, {instance.gender}
+    previous = getattr(instance, '_listed_in', None)
+    if previous:
+        category_ids.add(previous[0])
+        genders.add(previous[1])
+    evict_product_ids(category_ids, genders)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_product_images(sender, instance, **kwargs):
+    """Меняет версию изображений товара (входит в ETag страницы товара)"""
+    bump_version(images_version_key(instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Contact)
+def invalidate_reference(sender, **kwargs):
+    """Сбрасывает справочные данные (категории и контакты) во всех процессах"""
+    bump_version(REFERENCE_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_ids(sender, instance, **kwargs):
+    """Сбрасывает списки id категории"""
+    evict_product_ids([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_review_fragments(sender, instance, **kwargs):
+    """Сбрасывает фрагменты отзывов и рейтинга товара (и прежнего товара отзыва)"""
+    previous = getattr(instance, '_counted_as', None)
+    for product_id in {instance.product_id, previous[0] if previous else None} - {None}:
+        bump_version(reviews_version_key(product_id))
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    """Запоминает, как отзыв учитывался в рейтинге до сохранения"""
+    instance._counted_as = (
+        Review.objects.filter(pk=instance.pk, is_approved=True).values_list('product_id', 'rating').first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, **kwargs):
+    """Переносит оценку отзыва в рейтинг товара при создании, одобрении и снятии одобрения"""
+    before = getattr(instance, '_counted_as', None)
+    after = (instance.product_id, instance.rating) if instance.is_approved else None
+    if before == after:
+        return
+    if before:
+        apply_review(*before, delta=-1)
+    if after:
+        apply_review(*after, delta=1)
+    invalidate_rating_order({before[0] if before else None, instance.product_id} - {None})
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, origin=None, **kwargs):
+    """Убирает оценку удалённого одобренного отзыва из рейтинга товара"""
+    # Отзывы удаляются вместе с товаром (или его категорией): пересчитывать нечего
+    if isinstance(origin, (Product, Category)) or getattr(origin, 'model', None) in (Product, Category):
+        return
+    if instance.is_approved:
+        apply_review(instance.product_id, instance.rating, delta=-1)
+        invalidate_rating_order({instance.product_id})
+
+
+def invalidate_rating_order(product_ids):
+    # Изменился рейтинг - устарели сортировка по рейтингу и кэши каталога
+    for category_id, gender in Product.objects.filter(pk__in=product_ids).values_list('category_id', 'gender'):
+        evict_product_ids([category_id], [gender])
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete])
+def publish_invalidation(sender, instance, using, **kwargs):
+    """Публикует изменение модели магазина в шину сброса кэшей процессов"""
+    if invalidation_bus_enabled() and sender._meta.app_label == 'shop':
+        publish(instance, using)
+
+
+@receiver(connection_created)
+def install_query_cache_hook(sender, connection, **kwargs):
+    """Подключает к новому соединению инвалидацию кэша запросов по записям в таблицы"""
+    if record_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_write)
@@ -0,0 +1,12 @@
+from django import template
+
+from shop.fragments import CARD_TEMPLATE, render_cards
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_cards(products, template_name=CARD_TEMPLATE):
+    """HTML карточек товаров из кэша фрагментов: {% product_cards products [шаблон] as cards %}"""
+    return render_cards(products, template_name)
@@ -1,3 +1,844 @@
-from django.test import TestCase
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import OperationalError, connection, transaction
+from django.forms import inlineformset_factory
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import ProductVariantForm
+from .cache import get_or_compute, get_version, reviews_version_key
+from .catalog import (
+    DEFAULT_PAGE_SIZE, ID_LIST_TIMEOUT, SORT_KEY_FIELDS, CatalogSpec, id_list_key, product_ids,
+)
+from .facets import get_facets
+from .invalidation import dispatch, start_listener, subscribe
+from .memory_catalog import MemoryCatalog, np
+from .pages import check_page_cache
+from .models import Category, Product, ProductVariant, Review, SearchWord
+from .pagination import DEFAULT_SORT, SORT_ORDERS, count_products, cursor_after, decode_cursor, paginate_keyset
+from .ratings import recompute_ratings
+from .related import changed_products, compute_related
+from .reference import active_categories, reference_cache
+from .search import autocomplete_products, build_search_query, correct_spelling, search_products
+from .text import normalize_search_text
+from .views import paginate_reviews
+
+
+def create_variant(stock):
+    category = Category.objects.create(name='Test', slug='test')
+    product = Product.objects.create(
+        name='Test dress', slug='test-dress', description='Test', category=category,
+        price=Decimal('100000'), main_image='products/test.jpg',
+    )
+    return ProductVariant.objects.create(product=product, sku='TEST-M-BLACK', size='m', color='Black', stock=stock)
+
+
+def create_products(count, **fields):
+    category, _ = Category.objects.get_or_create(slug='test', defaults={'name': 'Test'})
+    return [
+        Product.objects.create(**{
+            'name': f'Test dress {index}', 'slug': f'test-dress-{index}', 'description': 'Test',
+            'category': category, 'price': Decimal('100000'), 'main_image': 'products/test.jpg', **fields,
+        })
+        for index in range(count)
+    ]
+
+
+_slugs = itertools.count()
+
+
+def create_product(name, description='Test', **fields):
+    category, _ = Category.objects.get_or_create(slug='test', defaults={'name': 'Test'})
+    return Product.objects.create(**{
+        'name': name, 'slug': f'product-{next(_slugs)}', 'description': description, 'category': category,
+        'price': Decimal('100000'), 'main_image': 'products/test.jpg', **fields,
+    })
+
+
+class ProductVariantTests(TestCase):
+    def test_normalizes_size_and_color(self):
+        variant = create_variant(stock=1)
+        self.assertEqual((variant.size, variant.color), ('M', 'black'))
+
+    def test_case_variant_duplicate_is_invalid(self):
+        variant = create_variant(stock=1)
+        duplicate = ProductVariant(product=variant.product, sku='TEST-M-BLACK-2', size='M ', color='black')
+        with self.assertRaises(ValidationError):
+            duplicate.full_clean()
+
+    def test_case_variant_duplicate_rows_are_invalid(self):
+        product = create_variant(stock=1).product
+        VariantFormSet = inlineformset_factory(
+            Product, ProductVariant, form=ProductVariantForm, fields=['sku', 'size', 'color', 'stock'], extra=0,
+        )
+        rows = [('TEST-L-WHITE', 'L', 'white'), ('TEST-L-WHITE-2', 'l', 'White')]
+        data = {'variants-TOTAL_FORMS': 2, 'variants-INITIAL_FORMS': 0}
+        for index, (sku, size, color) in enumerate(rows):
+            data.update({
+                f'variants-{index}-sku': sku, f'variants-{index}-size': size,
+                f'variants-{index}-color': color, f'variants-{index}-stock': 1,
+            })
+        formset = VariantFormSet(data, instance=product, queryset=ProductVariant.objects.none())
+        self.assertFalse(formset.is_valid())
+
+        # Строка совпадает с уже сохраненным вариантом M / black
+        data.update({'variants-0-size': 'S', 'variants-1-size': 'm', 'variants-1-color': 'Black'})
+        formset = VariantFormSet(data, instance=product, queryset=ProductVariant.objects.none())
+        self.assertFalse(formset.is_valid())
+        self.assertTrue(formset.forms[1].errors)
+
+    def test_product_options_keep_display_case(self):
+        product = create_products(1, available_sizes='s, M', available_colors='Черный, синий')[0]
+        product.refresh_from_db()
+        self.assertEqual((product.sizes, product.colors), (['S', 'M'], ['черный', 'синий']))
+        self.assertEqual(product.available_sizes_list, ['s', 'M'])
+        self.assertEqual(product.available_colors_list, ['Черный', 'синий'])
+
+    def test_decrement_stock_refuses_oversell(self):
+        variant = create_variant(stock=2)
+        self.assertFalse(ProductVariant.decrement_stock(variant.pk, 3))
+        self.assertTrue(ProductVariant.decrement_stock(variant.pk, 2))
+        self.assertFalse(ProductVariant.decrement_stock(variant.pk))
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock, 0)
+
+
+class ProductVariantConcurrencyTests(TransactionTestCase):
+    def test_parallel_decrements_never_oversell(self):
+        stock, buyers = 10, 25
+        variant = create_variant(stock=stock)
+        barrier = threading.Barrier(buyers)
+        results = []
+
+        def buy():
+            try:
+                barrier.wait()
+                results.append(ProductVariant.decrement_stock(variant.pk))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        variant.refresh_from_db()
+        self.assertEqual(results.count(True), stock)
+        self.assertEqual(variant.stock, 0)
+
+
+class SearchTests(TestCase):
+    def search(self, text):
+        return [product.name for product in search_products(Product.objects.all(), text).order_by('-rank', 'id')]
+
+    def test_words_match_as_prefixes(self):
+        create_product('Летнее платье')
+        create_product('Джинсы')
+        self.assertEqual(self.search('плат'), ['Летнее платье'])
+        self.assertEqual(self.search('лет плат'), ['Летнее платье'])
+        self.assertEqual(self.search('sum'), [])
+
+    def test_title_matches_rank_first(self):
+        create_product('Юбка миди', description='Хорошо сочетается с любым платьем')
+        create_product('Вечернее платье', description='Длинное')
+        self.assertEqual(self.search('платье'), ['Вечернее платье', 'Юбка миди'])
+
+    def test_uses_gin_index(self):
+        create_product('Летнее платье')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Product.objects.filter(search_vector=build_search_query('платье')).explain()
+        self.assertIn('shop_product_search_gin', plan)
+
+
+class NormalizeSearchTextTests(TestCase):
+    cases = [
+        ('платье', 'plate'),
+        ('platye', 'plate'),
+        ('plate', 'plate'),
+        ('Платье!', 'plate'),
+        ('плaтье', 'plate'),  # латинская "a"
+        ('Майка', 'maika'),
+        ('mayka', 'maika'),
+        ('majka', 'maika'),
+        ('КУРТКА-парка', 'kurtka parka'),
+        ('  ', ''),
+    ]
+
+    def test_normalization(self):
+        for text, expected in self.cases:
+            with self.subTest(text=text):
+                self.assertEqual(normalize_search_text(text), expected)
+
+    def test_spellings_find_the_same_products(self):
+        dress = create_product('Летнее платье')
+        create_product('Джинсы')
+        for text in ('платье', 'platye', 'plate'):
+            with self.subTest(text=text):
+                self.assertEqual(list(search_products(Product.objects.all(), text)), [dress])
+                self.assertEqual(autocomplete_products(Product.objects.all(), text), [dress])
+
+    def test_mixed_script_input(self):
+        dress = create_product('Летнее платье')
+        for text in ('плaтье', 'летнее platye', 'plаtye & | ! :*'):
+            with self.subTest(text=text):
+                self.assertEqual(list(search_products(Product.objects.all(), text)), [dress])
+
+
+class AutocompleteTests(TestCase):
+    def autocomplete(self, text):
+        return [product.name for product in autocomplete_products(Product.objects.all(), text)]
+
+    def test_tiers_go_from_name_start_to_category(self):
+        dresses = Category.objects.create(name='Платья', slug='dresses')
+        create_product('Суперплатье')
+        create_product('Сарафан', category=dresses)
+        create_product('Красное платье')
+        create_product('Платье красное')
+        create_product('Джинсы')
+        self.assertEqual(self.autocomplete('плат'), ['Платье красное', 'Красное платье', 'Суперплатье', 'Сарафан'])
+
+    def test_typos_are_corrected_by_vocabulary(self):
+        create_product('Куртка зимняя')
+        self.assertEqual(correct_spelling('kurtla'), 'kurtka')
+        self.assertEqual(self.autocomplete('куртла'), ['Куртка зимняя'])
+        self.assertIsNone(correct_spelling('zzzzzz'))
+        self.assertEqual(self.autocomplete('zzzzzz'), [])
+
+    def test_rebuild_fills_vocabulary(self):
+        create_product('Куртка зимняя 2024')
+        create_product('Платье')
+        SearchWord.objects.all().delete()
+        self.assertEqual(SearchWord.rebuild(), 3)
+        self.assertEqual(set(SearchWord.objects.values_list('word', flat=True)), {'kurtka', 'zimna', 'plate'})
+
+
+class CatalogSpecTests(SimpleTestCase):
+    def test_categories_skip_non_decimal_values(self):
+        # '²'.isdigit() истинно, но int('²') - ValueError
+        spec = CatalogSpec.from_query({'categories': '3, 1,²,x,,1'})
+        self.assertEqual(spec.categories, (1, 3))
+
+
+class FavoritesDataTests(TestCase):
+    def test_ids_skip_non_decimal_values(self):
+        product = create_products(1)[0]
+        response = self.client.get(reverse('shop:api_favorites_data'), {'ids': f'{product.pk},²,x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['products']], [product.pk])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, sort_by, per_page):
+        """id товаров всех страниц, пройденных по курсорам"""
+        products = Product.objects.cards(*SORT_KEY_FIELDS)
+        ids, cursor = [], None
+        while True:
+            page = paginate_keyset(products, sort_by, cursor, per_page)
+            ids += [product.pk for product in page]
+            if not page.has_next:
+                return ids
+            cursor = page.next_cursor
+
+    def test_equal_sort_keys_are_paged_by_id(self):
+        create_products(7)
+        for sort_by, orders in SORT_ORDERS.items():
+            with self.subTest(sort_by=sort_by):
+                expected = list(Product.objects.order_by(*orders).values_list('id', flat=True))
+                self.assertEqual(self.walk(sort_by, per_page=3), expected)
+
+    def test_cursor_round_trip(self):
+        product = create_products(1, avg_rating=Decimal('4.37'))[0]
+        product = Product.objects.cards(*SORT_KEY_FIELDS).get(pk=product.pk)
+        for sort_by, orders in SORT_ORDERS.items():
+            with self.subTest(sort_by=sort_by):
+                values = decode_cursor(Product, sort_by, cursor_after(sort_by, product))
+                self.assertEqual(values, [getattr(product, order.lstrip('-')) for order in orders])
+        self.assertIsNone(decode_cursor(Product, 'price-low', cursor_after('newest', product)))
+        self.assertIsNone(decode_cursor(Product, 'newest', 'not-a-cursor'))
+
+    def test_first_catalog_page_continues_with_load_more(self):
+        create_products(DEFAULT_PAGE_SIZE + 5)
+        response = self.client.get(reverse('shop:catalog'))
+        ids = [product.pk for product in response.context['products']]
+        cursor = response.context['next_cursor']
+        self.assertIsNotNone(cursor)
+
+        response = self.client.get(reverse('shop:htmx_load_more_products'), {'cursor': cursor})
+        ids += [product.pk for product in response.context['products']]
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(ids, list(Product.objects.order_by(*SORT_ORDERS['name']).values_list('id', flat=True)))
+
+
+class CountProductsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_filtered_products(self):
+        create_products(3)
+        self.assertEqual(count_products(Product.objects.filter(name__endswith='1')), (1, False))
+
+    def test_search_without_words_counts_nothing(self):
+        create_products(3)
+        self.assertEqual(count_products(search_products(Product.objects.all(), '!!!')), (0, False))
+
+    @mock.patch('shop.pagination.estimate_count', return_value=1764)
+    def test_search_without_matches_shows_empty_result(self, estimate_count):
+        create_products(3)
+        response = self.client.get(reverse('shop:catalog'), {'search': 'несуществующее'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 0)
+        self.assertFalse(response.context['page_obj'].has_next())
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, '≈')
+        estimate_count.assert_not_called()
+
+    @mock.patch('shop.pagination.estimate_count', return_value=1764)
+    def test_estimate_is_only_displayed(self, estimate_count):
+        create_products(3, old_price=Decimal('200000.00'))
+        response = self.client.get(reverse('shop:catalog'), {'discount': 50})
+        page_obj = response.context['page_obj']
+        self.assertContains(response, 'Найдено товаров: ≈1764')
+        self.assertEqual(len(page_obj), 3)
+        self.assertEqual(page_obj.paginator.num_pages, 1)
+        self.assertFalse(page_obj.has_next())
+        self.assertIsNone(response.context['next_cursor'])
+
+    @mock.patch('shop.pagination.estimate_count', return_value=1764)
+    def test_estimate_pages_by_fetched_rows(self, estimate_count):
+        create_products(3, old_price=Decimal('200000.00'))
+        params = {'discount': 50, 'page_size': 2}
+        with mock.patch('shop.catalog.PAGE_SIZES', (2,)):
+            first = self.client.get(reverse('shop:catalog'), params)
+            last = self.client.get(reverse('shop:catalog'), {**params, 'page': 9})
+        self.assertTrue(first.context['page_obj'].has_next())
+        self.assertEqual(last.status_code, 200)
+        self.assertEqual(last.context['page_obj'].number, 2)
+        self.assertEqual(len(last.context['page_obj']), 1)
+
+
+class ProductIdListTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.dresses = Category.objects.create(name='Платья', slug='dresses')
+        self.coats = Category.objects.create(name='Пальто', slug='coats')
+        self.product = create_product('Платье', category=self.dresses, gender='women')
+
+    def ids(self, category=None, **params):
+        return product_ids(CatalogSpec.from_query(params), category)
+
+    def test_category_change_evicts_old_and_new_lists(self):
+        self.assertEqual(self.ids(self.dresses), [self.product.pk])
+        self.assertEqual(self.ids(self.coats), [])
+
+        self.product.category = self.coats
+        self.product.save()
+        self.assertEqual(self.ids(self.dresses), [])
+        self.assertEqual(self.ids(self.coats), [self.product.pk])
+
+    def test_gender_change_evicts_old_and_new_lists(self):
+        self.assertEqual(self.ids(gender='women'), [self.product.pk])
+        self.assertEqual(self.ids(self.dresses, gender='men'), [])
+
+        self.product.gender = 'men'
+        self.product.save()
+        self.assertEqual(self.ids(gender='women'), [])
+        self.assertEqual(self.ids(self.dresses, gender='men'), [self.product.pk])
+
+    def test_bulk_writes_are_covered_by_timeout(self):
+        self.assertEqual(self.ids(self.dresses), [self.product.pk])
+        key = id_list_key(self.dresses.pk, None, DEFAULT_SORT)
+        # bulk_create() и update() не отправляют сигналов: список устаревает только по сроку
+        created = Product.objects.bulk_create([Product(
+            name='Платье 2', slug='bulk-dress', description='Test', category=self.dresses,
+            price=Decimal('100000'), main_image='products/test.jpg',
+        )])
+        Product.objects.filter(pk=self.product.pk).update(category=self.coats)
+        self.assertEqual(self.ids(self.dresses), [self.product.pk])
+        value, version, expires, delta = cache.get(key)
+        self.assertAlmostEqual(expires, time.time() + ID_LIST_TIMEOUT, delta=5)
+
+        cache.set(key, (value, version, time.time() - 1, delta))
+        self.assertEqual(self.ids(self.dresses), [self.product.pk])
+        deadline = time.monotonic() + 5
+        while cache.get(f'{key}:lock') is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.ids(self.dresses), [created[0].pk])
+
+
+class HomePageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_home_cards_keep_home_markup(self):
+        create_products(1, price=Decimal('125000.00'), old_price=Decimal('150000.00'))
+        response = self.client.get(reverse('shop:home'))
+        self.assertContains(response, '<span class="current-price">125000 сум</span>', count=2)
+        self.assertContains(response, '<span class="old-price">150000 сум</span>', count=2)
+        self.assertContains(response, 'class="action-btn favorite-btn"', count=2)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_disabled_by_default_without_shared_cache(self):
+        response = self.client.get(reverse('shop:home'))
+        self.assertNotIn('X-Page-Cache', response)
+        check_page_cache()
+
+    @override_settings(SHOP_PAGE_CACHE=True)
+    def test_enabled_page_cache_requires_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_page_cache()
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            check_page_cache()
+
+    @override_settings(SHOP_PAGE_CACHE=True)
+    def test_second_anonymous_request_is_served_from_cache(self):
+        self.assertEqual(self.client.get(reverse('shop:home'))['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(reverse('shop:home'))['X-Page-Cache'], 'hit')
+
+
+class DiscountTests(TestCase):
+    # (цена, старая цена, скидка)
+    cases = [
+        ('100000', None, 0),
+        ('100000', '100000', 0),
+        ('100000', '90000', 0),
+        ('100', '0', 0),
+        ('67', '100', 33),
+        ('2', '3', 33),
+        ('201', '300', 33),
+        ('1', '1000', 99),
+        ('999.99', '1000', 0),
+        ('990', '1000', 1),
+        ('50', '100', 50),
+        ('125000', '150000', 16),
+        ('0.01', '99999999.99', 99),
+        ('0', '100', 100),
+    ]
+
+    def test_database_discount_matches_discount_percentage(self):
+        for price, old_price, expected in self.cases:
+            with self.subTest(price=price, old_price=old_price):
+                product = create_product(
+                    'Test', price=Decimal(price), old_price=old_price and Decimal(old_price)
+                )
+                product.refresh_from_db()
+                self.assertEqual(product.discount_percentage, expected)
+                self.assertEqual(product.discount, expected)
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reference_cache.clear()
+        first, second = create_products(2, available_sizes='M,L', available_colors='black,white')
+        ProductVariant.objects.create(product=first, sku='F-M-BLACK', size='M', color='black', stock=1)
+        ProductVariant.objects.create(product=first, sku='F-L-WHITE', size='L', color='white', stock=0)
+        ProductVariant.objects.create(product=second, sku='S-L-WHITE', size='L', color='white', stock=2)
+
+    def counts(self, **params):
+        facets = get_facets(CatalogSpec.from_query(params))
+        return {facet: {value: count for value, _, count in data['values'] if count} for facet, data in facets.items()}
+
+    def test_in_stock_counts_sizes_and_colors_by_variant(self):
+        counts = self.counts(in_stock='1')
+        self.assertEqual(counts['size'], {'M': 1, 'L': 1})
+        self.assertEqual(counts['color'], {'black': 1, 'white': 1})
+
+        counts = self.counts(in_stock='1', size='L')
+        self.assertEqual(counts['color'], {'white': 1})
+        self.assertEqual(counts['size'], {'M': 1, 'L': 1})
+        self.assertEqual(counts['category'], {'test': 1})
+
+    def test_without_in_stock_counts_listed_options(self):
+        counts = self.counts(size='L')
+        self.assertEqual(counts['color'], {'black': 2, 'white': 2})
+        self.assertEqual(counts['category'], {'test': 2})
+
+    def test_search_without_words_has_empty_facets(self):
+        counts = self.counts(search='!!!')
+        self.assertEqual(counts, dict.fromkeys(('category', 'gender', 'size', 'color', 'price'), {}))
+        for url in (reverse('shop:catalog'), reverse('shop:htmx_catalog_filter')):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {'search': '!!!'}).status_code, 200)
+
+
+class RatingTests(TestCase):
+    def setUp(self):
+        self.first, self.second = create_products(2)
+        self.user = User.objects.create_user('reviewer')
+
+    def review(self, rating, **fields):
+        return Review.objects.create(
+            product=self.first, user=self.user, rating=rating, title='Test', text='Test', **fields
+        )
+
+    def assertRating(self, product, average, histogram):
+        product.refresh_from_db()
+        self.assertEqual(product.avg_rating, Decimal(average))
+        self.assertEqual(product.review_count, sum(histogram))
+        self.assertEqual([product.rating_count_1, product.rating_count_2, product.rating_count_3,
+                          product.rating_count_4, product.rating_count_5], histogram)
+
+    def test_incremental_updates_match_recompute(self):
+        five = self.review(5)
+        self.review(2)
+        self.review(4, is_approved=False)
+        self.assertRating(self.first, '3.50', [0, 1, 0, 0, 1])
+
+        five.rating = 3
+        five.save()
+        self.assertRating(self.first, '2.50', [0, 1, 1, 0, 0])
+
+        five.is_approved = False
+        five.save()
+        self.assertRating(self.first, '2.00', [0, 1, 0, 0, 0])
+
+        five.is_approved = True
+        five.save()
+        self.assertRating(self.first, '2.50', [0, 1, 1, 0, 0])
+
+        five.product = self.second
+        five.save()
+        self.assertRating(self.first, '2.00', [0, 1, 0, 0, 0])
+        self.assertRating(self.second, '3.00', [0, 0, 1, 0, 0])
+
+        five.delete()
+        self.assertRating(self.second, '0.00', [0, 0, 0, 0, 0])
+        self.assertEqual(recompute_ratings(), 0)
+
+    def test_recompute_fixes_drift_and_resets_fragments(self):
+        self.review(4)
+        Product.objects.filter(pk=self.first.pk).update(avg_rating=Decimal('1.00'), review_count=7)
+        version = get_version(reviews_version_key(self.first.pk))
+
+        self.assertEqual(recompute_ratings(), 1)
+        self.assertRating(self.first, '4.00', [0, 0, 0, 1, 0])
+        self.assertNotEqual(get_version(reviews_version_key(self.first.pk)), version)
+
+
+class ReviewPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_products(1)[0]
+        user = User.objects.create_user('reviewer')
+        now = timezone.now()
+        # Три группы отзывов с одинаковым created_at: страницы режут группы посередине
+        self.reviews = [
+            Review.objects.create(product=self.product, user=user, rating=5, title='Test', text='Test')
+            for _ in range(25)
+        ]
+        for index, review in enumerate(self.reviews):
+            Review.objects.filter(pk=review.pk).update(created_at=now - timedelta(hours=index // 9))
+        self.hidden = Review.objects.create(
+            product=self.product, user=user, rating=1, title='Hidden', text='Hidden', is_approved=False
+        )
+
+    def read_all(self):
+        ids, cursor = [], None
+        while True:
+            page = paginate_reviews(self.product, cursor)
+            ids.extend(review.pk for review in page)
+            cursor = page.next_cursor
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_ties_without_duplicates_or_gaps(self):
+        expected = list(
+            Review.objects.filter(product=self.product, is_approved=True)
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(len(expected), 25)
+        self.assertEqual(self.read_all(), expected)
+
+    def test_unapproved_reviews_are_excluded(self):
+        self.assertNotIn(self.hidden.pk, self.read_all())
+
+    def test_review_page_takes_two_queries(self):
+        url = reverse('shop:htmx_product_reviews', args=[self.product.slug])
+        # Товар и страница отзывов, без COUNT(*)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        with self.assertNumQueries(2):
+            self.client.get(url, {'cursor': response.context['reviews'].next_cursor})
+
+
+class ProductFragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product, self.other = create_products(2)
+        self.user = User.objects.create_user('reviewer')
+
+    def fragment(self, name, **params):
+        return self.client.get(reverse(f'shop:htmx_{name}', args=[self.product.slug]), params)
+
+    def test_fragments_are_cached(self):
+        for name in ('product_rating', 'product_reviews', 'related_products'):
+            with self.subTest(name=name):
+                first = self.fragment(name)
+                # Из кэша: только строка товара, без отзывов и похожих товаров
+                with self.assertNumQueries(1):
+                    second = self.fragment(name)
+                self.assertEqual(second.content, first.content)
+
+    def test_review_save_and_delete_rerender_fragments(self):
+        version = get_version(reviews_version_key(self.product.pk))
+        self.assertNotContains(self.fragment('product_reviews'), 'Отличное платье')
+        self.assertContains(self.fragment('product_rating'), 'rating-summary')
+
+        review = Review.objects.create(
+            product=self.product, user=self.user, rating=4, title='Отличное платье', text='Test'
+        )
+        self.assertNotEqual(get_version(reviews_version_key(self.product.pk)), version)
+        self.assertContains(self.fragment('product_reviews'), 'Отличное платье')
+        self.assertContains(self.fragment('product_rating'), '1 оценок')
+
+        review.delete()
+        self.assertNotContains(self.fragment('product_reviews'), 'Отличное платье')
+        self.assertNotContains(self.fragment('product_rating'), '1 оценок')
+
+    def test_product_page_shell_does_not_query_reviews(self):
+        Review.objects.create(product=self.product, user=self.user, rating=5, title='Отличное платье', text='Test')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop:product_detail', args=[self.product.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Отличное платье')
+        self.assertFalse([query for query in queries if 'shop_review' in query['sql']])
+
+
+@skipIf(np is None, 'NumPy не установлен')
+class MemoryCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bus_event_reloads_snapshot(self):
+        cheap, expensive = create_products(2)
+        memory = MemoryCatalog()
+        spec = CatalogSpec(sort='price-low')
+        Product.objects.filter(pk=cheap.pk).update(price=Decimal('1000'))
+        self.assertEqual(list(memory.product_ids(spec)), [cheap.pk, expensive.pk])
+
+        # UPDATE мимо сигналов: версия каталога не меняется, снимок прежний
+        Product.objects.filter(pk=expensive.pk).update(price=Decimal('10'))
+        self.assertEqual(list(memory.product_ids(spec)), [cheap.pk, expensive.pk])
+
+        with mock.patch('shop.memory_catalog.memory_catalog', memory):
+            dispatch('shop.product', expensive.pk)
+        self.assertEqual(list(memory.product_ids(spec)), [expensive.pk, cheap.pk])
+
+
+@skipIf(np is None, 'NumPy не установлен')
+class RelatedProductsTests(TestCase):
+    words = ['платье', 'юбка', 'рубашка', 'брюки', 'куртка', 'пальто', 'шорты', 'свитер', 'жилет', 'блузка']
+
+    def related(self):
+        return {
+            product.pk: list(product.related_links.values_list('related_id', flat=True))
+            for product in Product.objects.all()
+        }
+
+    def test_incremental_run_adds_new_product_to_neighbours(self):
+        for product, word in zip(create_products(len(self.words)), self.words):
+            product.name = product.description = f'{word} {word}'
+            product.save()
+        compute_related(limit=3)
+        self.assertEqual(changed_products(), set())
+
+        twin = Product.objects.get(name='юбка юбка')
+        new = create_products(1, name='юбка юбка', description='юбка юбка', slug='new-skirt')[0]
+        compute_related(changed_products(), limit=3)
+        self.assertIn(new.pk, self.related()[twin.pk])
+
+        incremental = self.related()
+        compute_related(limit=3)
+        self.assertEqual(self.related(), incremental)
+
+
+class GetOrComputeTests(SimpleTestCase):
+    workers = 30
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def compute(self, value):
+        def compute():
+            self.calls.append(value)
+            time.sleep(0.2)
+            return value
+        return compute
+
+    def burst(self, func):
+        barrier = threading.Barrier(self.workers)
+        results = []
+
+        def run():
+            barrier.wait()
+            results.append(func())
+
+        threads = [threading.Thread(target=run) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def wait_for_refresh(self, key):
+        deadline = time.monotonic() + 5
+        while cache.get(f'{key}:lock') is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_missing_key_is_computed_once(self):
+        results = self.burst(lambda: get_or_compute('test:key', self.compute('fresh'), 60))
+        self.assertEqual(self.calls, ['fresh'])
+        self.assertEqual(results, ['fresh'] * self.workers)
+
+    def test_stale_value_is_served_and_refreshed_once(self):
+        get_or_compute('test:key', self.compute('old'), 60, version=1)
+        self.calls.clear()
+
+        results = self.burst(lambda: get_or_compute('test:key', self.compute('new'), 60, version=2))
+        self.assertEqual(results, ['old'] * self.workers)
+        self.wait_for_refresh('test:key')
+        self.assertEqual(self.calls, ['new'])
+        self.assertEqual(get_or_compute('test:key', self.compute('newer'), 60, version=2), 'new')
+
+    def test_stale_value_is_served_when_database_is_down(self):
+        get_or_compute('test:key', self.compute('old'), 60, version=1)
+
+        def database_down():
+            raise OperationalError('database is down')
+
+        with self.assertLogs('shop.cache', 'ERROR'):
+            self.assertEqual(get_or_compute('test:key', database_down, 60, version=2), 'old')
+            self.wait_for_refresh('test:key')
+        with self.assertRaises(OperationalError):
+            get_or_compute('test:missing', database_down, 60)
+
+
+class LocalCacheEvictionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reference_cache.clear()
+
+    def test_bus_event_returns_fresh_reference_data(self):
+        category = Category.objects.create(name='Old', slug='old')
+        self.assertEqual([item.name for item in active_categories()], ['Old'])
+
+        # Изменение из другого процесса: сигналы этого процесса его не видели
+        Category.objects.filter(pk=category.pk).update(name='New')
+        self.assertEqual([item.name for item in active_categories()], ['Old'])
+
+        dispatch('shop.category', category.pk)
+        self.assertEqual([item.name for item in active_categories()], ['New'])
+
+
+class QueryCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_products(1, name='Old')[0]
+
+    def names(self):
+        return list(Product.objects.order_by('id').values_list('name', flat=True).cached())
+
+    def assertCachedNames(self, names):
+        self.assertEqual(self.names(), names)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.names(), names)
+        self.assertEqual(len(queries), 0)
+
+    def test_save_update_and_delete(self):
+        self.assertCachedNames(['Old'])
+        self.product.name = 'Saved'
+        self.product.save()
+        self.assertCachedNames(['Saved'])
+        Product.objects.update(name='Updated')
+        self.assertCachedNames(['Updated'])
+        self.product.delete()
+        self.assertCachedNames([])
+
+    def test_bulk_create(self):
+        self.assertCachedNames(['Old'])
+        Product.objects.bulk_create([Product(
+            name='Bulk', slug='bulk', description='Test', category=self.product.category,
+            price=Decimal('1'), main_image='products/test.jpg',
+        )])
+        self.assertCachedNames(['Old', 'Bulk'])
+
+    def test_raw_sql_write(self):
+        self.assertCachedNames(['Old'])
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE shop_product SET name = %s WHERE id = %s', ['Raw', self.product.pk])
+        self.assertCachedNames(['Raw'])
+
+    def test_rollback(self):
+        self.assertCachedNames(['Old'])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Product.objects.update(name='Rolled back')
+            # Незафиксированные строки видит только эта транзакция: в обход кэша
+            self.assertEqual(self.names(), ['Rolled back'])
+            raise RuntimeError
+        self.assertCachedNames(['Old'])
+
+    def test_query_with_non_shop_table_is_not_cached(self):
+        products = Product.objects.filter(reviews__user__username='nobody').cached()
+        self.assertEqual(list(products), [])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(products.all()), [])
+        self.assertEqual(len(queries), 1)
+
+
+def listen_for_products(events):
+    """Процесс-воркер: передает родителю полученные по шине события товаров"""
+    subscribe('shop.product', lambda model_label, pk: events.put((os.getpid(), pk)))
+    start_listener(timeout=10)
+    events.put((os.getpid(), 'ready'))
+    time.sleep(30)
+
+
+@override_settings(SHOP_INVALIDATION_BUS=True)
+class InvalidationBusTests(TransactionTestCase):
+    workers = 3
+
+    def test_change_reaches_every_worker_process(self):
+        context = multiprocessing.get_context('fork')
+        events = context.Queue()
+        processes = [context.Process(target=listen_for_products, args=(events,)) for _ in range(self.workers)]
+        for process in processes:
+            process.start()
+        try:
+            ready = {events.get(timeout=10) for _ in processes}
+            self.assertEqual(ready, {(process.pid, 'ready') for process in processes})
+
+            variant = create_variant(stock=1)
+            received = set()
+            while len(received) < self.workers:
+                try:
+                    received.add(events.get(timeout=10))
+                except queue.Empty:
+                    break
+            self.assertEqual(received, {(process.pid, variant.product_id) for process in processes})
+        finally:
+            for process in processes:
+                process.terminate()
+                process.join()
@@ -0,0 +1,38 @@
+import re
+
+
+# Кириллица -> латиница (упрощённая транслитерация)
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+TRANSLIT_TABLE = str.maketrans(CYRILLIC_TO_LATIN)
+
+# Разные способы записать один и тот же звук латиницей сводятся к одному
+# ("platye" и "plate" -> "plate", "mayka" и "majka" -> "maika").
+# Порядок важен: длинные сочетания заменяются раньше коротких
+LATIN_FOLDING = [
+    ('shch', 'sh'), ('tch', 'ch'), ('kh', 'h'), ('ck', 'k'),
+    ('ye', 'e'), ('yo', 'o'), ('yu', 'u'), ('ya', 'a'),
+    ('y', 'i'), ('j', 'i'), ('w', 'v'), ('q', 'k'), ('x', 'ks'),
+]
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+REPEATED_RE = re.compile(r'([a-z])\1+')
+
+
+def normalize_search_text(text):
+    """Нормализует строку для поиска независимо от алфавита.
+
+    Приводит к нижнему регистру, транслитерирует кириллицу, сводит
+    варианты латинской записи к одному, схлопывает повторы букв и
+    заменяет знаки препинания пробелами.
+    """
+    text = text.lower().translate(TRANSLIT_TABLE)
+    for source, target in LATIN_FOLDING:
+        text = text.replace(source, target)
+    text = REPEATED_RE.sub(r'\1', text)
+    return ' '.join(NON_WORD_RE.sub(' ', text).split())
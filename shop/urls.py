@@ -16,6 +16,9 @@ urlpatterns = [
     path('htmx/catalog/filter/', views.htmx_catalog_filter, name='htmx_catalog_filter'),
     path('htmx/search/', views.htmx_product_search, name='htmx_product_search'),
     path('htmx/product/<slug:slug>/', views.htmx_product_details, name='htmx_product_details'),
+    path('htmx/product/<slug:slug>/reviews/', views.htmx_product_reviews, name='htmx_product_reviews'),
+    path('htmx/product/<slug:slug>/rating/', views.htmx_product_rating, name='htmx_product_rating'),
+    path('htmx/product/<slug:slug>/related/', views.htmx_related_products, name='htmx_related_products'),
     path('htmx/products/load-more/', views.htmx_load_more_products, name='htmx_load_more_products'),
     path('htmx/favorite/toggle/<int:product_id>/', views.htmx_toggle_favorite, name='htmx_toggle_favorite'),
     
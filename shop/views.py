@@ -1,27 +1,45 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
-from django.db.models import Q, Avg
 from django.conf import settings
 from django.http import JsonResponse
 from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 import json
 
 from .models import (
-    Category, Product, ProductImage, Review, Contact
+    Product, ProductImage, Review
 )
+from .cache import get_catalog_version, get_version, reviews_version_key
+from .catalog import DISCOUNT_FILTERS, CatalogSpec, IdListPaginator, instrument, product_ids
+from .conditional import (
+    favorite_ids, favorites_etag, listing_etag, listing_last_modified, product_etag, product_last_modified,
+)
+from .facets import get_facets
+from .fragments import render_fragment
+from .memory_catalog import is_enabled as memory_catalog_enabled, memory_catalog
+from .pagination import CountingPaginator, cursor_after, paginate_keyset
+from .pages import versioned_page
+from .reference import active_categories, active_contact
+from .search import autocomplete_products, search_products
+
+
+REVIEWS_PER_PAGE = 10
+RELATED_PRODUCTS_COUNT = 4
 
 
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
+@versioned_page
 def home(request):
     """Главная страница"""
     # Получаем рекомендуемые товары
-    featured_products = Product.objects.all()[:8]
+    featured_products = list(Product.objects.cards().cached()[:8])
     
     # Получаем категории
-    categories = Category.objects.filter(is_active=True)[:3]
+    categories = active_categories()[:3]
     
-    # Получаем последние товары
-    latest_products = Product.objects.all()[:8]
+    # Последние товары - та же выборка (порядок по умолчанию -created_at)
+    latest_products = featured_products
     
     context = {
         'featured_products': featured_products,
@@ -31,112 +49,97 @@ def home(request):
     return render(request, 'shop/home.html', context)
 
 
-def catalog(request):
-    """Страница каталога с фильтрацией по категориям и полу"""
-    products = Product.objects.all()
-    categories = Category.objects.filter(is_active=True)
-    
-    # Фильтрация по категории
-    category_slug = request.GET.get('category')
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug, is_active=True)
-        products = products.filter(category=category)
+def _catalog_context(request, spec):
+    """Общий контекст страницы каталога для всех представлений списка товаров"""
+    category = spec.get_category()
+    products = spec.queryset(category)
+    
+    # Пагинация: по курсору, если он передан, иначе по номеру страницы
+    cursor = request.GET.get('cursor')
+    if cursor is not None:
+        page_obj = None
+        products_page = paginate_keyset(products, spec.sort, cursor, spec.page_size)
+        next_cursor = products_page.next_cursor
     else:
-        category = None
-    
-    # Фильтрация по полу
-    gender = request.GET.get('gender')
-    if gender:
-        products = products.filter(gender=gender)
-    
-    # Поиск
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
-    
-    # Сортировка
-    sort_by = request.GET.get('sort', 'name')
-    if sort_by == 'price-low':
-        products = products.order_by('price')
-    elif sort_by == 'price-high':
-        products = products.order_by('-price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    else:
-        products = products.order_by('name')
-    
-    # Пагинация
-    page_size = int(request.GET.get('page_size', 12))
-    paginator = Paginator(products, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Формируем query_params для пагинации
-    query_params = ''
-    if category_slug:
-        query_params += f'&category={category_slug}'
-    if gender:
-        query_params += f'&gender={gender}'
-    if search_query:
-        query_params += f'&search={search_query}'
-    if sort_by and sort_by != 'name':
-        query_params += f'&sort={sort_by}'
-    if page_size != 12:
-        query_params += f'&page_size={page_size}'
+        ids = memory_catalog.product_ids(spec, category) if memory_catalog_enabled() else None
+        if ids is None and spec.has_id_list:
+            # Частые комбинации фильтров: без сортировки и COUNT(*) в Postgres
+            ids = product_ids(spec, category)
+        if ids is not None:
+            paginator = IdListPaginator(ids, spec.page_size)
+        else:
+            paginator = CountingPaginator(
+                products, spec.page_size, filter_key=spec.filter_key, estimate=spec.has_count_estimate
+            )
+        page_obj = paginator.get_page(request.GET.get('page'))
+        products_page = page_obj
+        # "Показать еще" продолжает страницу по курсору от её последнего товара
+        next_cursor = cursor_after(spec.sort, page_obj[-1]) if page_obj.has_next() and len(page_obj) else None
     
-    context = {
-        'products': page_obj,
+    return {
+        'products': products_page,
         'page_obj': page_obj,
-        'categories': categories,
+        'next_cursor': next_cursor,
+        'categories': active_categories(),
         'current_category': category,
-        'current_gender': gender,
-        'search_query': search_query,
-        'sort_by': sort_by,
-        'query_params': query_params,
+        'current_gender': spec.gender,
+        'current_size': spec.size,
+        'current_color': spec.color,
+        'in_stock': spec.in_stock,
+        'min_discount': spec.min_discount,
+        'discount_filters': DISCOUNT_FILTERS,
+        'search_query': spec.search,
+        'sort_by': spec.sort,
+        'query_params': spec.query_params,
+        'facets': get_facets(spec, category),
     }
-    return render(request, 'shop/catalog.html', context)
 
 
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
+@versioned_page
+def catalog(request):
+    """Страница каталога с фильтрацией по категориям и полу"""
+    spec = CatalogSpec.from_query(request.GET)
+    with instrument('catalog', spec):
+        return render(request, 'shop/catalog.html', _catalog_context(request, spec))
+
+
+@condition(etag_func=product_etag, last_modified_func=product_last_modified)
 def product_detail(request, slug):
     """Страница товара"""
-    product = get_object_or_404(Product, slug=slug)
+    # Оболочка страницы: только строка товара (и его категория тем же запросом).
+    # Рейтинг, отзывы и похожие товары подгружаются HTMX-фрагментами
+    product = get_object_or_404(Product.objects.select_related('category'), slug=slug)
     
     # Получаем дополнительные изображения
     images = product.images.all().order_by('order')
     
-    # Получаем отзывы
-    reviews = Review.objects.filter(product=product, is_approved=True).order_by('-created_at')
-    
-    # Вычисляем средний рейтинг
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-    
-    # Получаем похожие товары
-    related_products = Product.objects.filter(
-        category=product.category
-    ).exclude(id=product.id)[:4]
-    
     context = {
         'product': product,
         'images': images,
-        'reviews': reviews,
-        'avg_rating': avg_rating,
-        'related_products': related_products,
     }
     return render(request, 'shop/product_detail.html', context)
 
 
+def paginate_reviews(product, cursor=None):
+    """Страница одобренных отзывов товара после курсора"""
+    reviews = Review.objects.filter(product=product, is_approved=True).select_related('user')
+    return paginate_keyset(reviews, 'reviews', cursor, REVIEWS_PER_PAGE)
+
+
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
+@versioned_page
 def about(request):
     """Страница о нас"""
     context = {}
     return render(request, 'shop/about.html', context)
 
 
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
+@versioned_page
 def contact(request):
     """Страница контактов"""
-    contact_info = Contact.objects.filter(is_active=True).first()
+    contact_info = active_contact()
     
     context = {
         'contact_info': contact_info,
@@ -147,84 +150,21 @@ def contact(request):
 
 
 # HTMX Views
+@vary_on_headers('HX-Request')
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 def htmx_catalog_filter(request):
     """HTMX представление для фильтрации каталога"""
-    products = Product.objects.all()
-    
-    # Фильтрация по категории
-    category_slug = request.GET.get('category')
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug, is_active=True)
-        products = products.filter(category=category)
-    else:
-        category = None
-    
-    # Фильтрация по полу
-    gender = request.GET.get('gender')
-    if gender:
-        products = products.filter(gender=gender)
-    
-    # Поиск
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
-    
-    # Сортировка
-    sort_by = request.GET.get('sort', 'name')
-    if sort_by == 'price-low':
-        products = products.order_by('price')
-    elif sort_by == 'price-high':
-        products = products.order_by('-price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    else:
-        products = products.order_by('name')
-    
-    # Пагинация
-    page_size = int(request.GET.get('page_size', 12))
-    paginator = Paginator(products, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Фильтрация по множественным категориям
-    categories = request.GET.get('categories')
-    if categories:
-        category_ids = categories.split(',')
-        products = products.filter(category_id__in=category_ids)
-    
-    # Формируем query_params для пагинации
-    query_params = ''
-    if category_slug:
-        query_params += f'&category={category_slug}'
-    if categories:
-        query_params += f'&categories={categories}'
-    if gender:
-        query_params += f'&gender={gender}'
-    if search_query:
-        query_params += f'&search={search_query}'
-    if sort_by and sort_by != 'name':
-        query_params += f'&sort={sort_by}'
-    if page_size != 12:
-        query_params += f'&page_size={page_size}'
-    
-    context = {
-        'products': page_obj,
-        'page_obj': page_obj,
-        'current_category': category,
-        'current_gender': gender,
-        'search_query': search_query,
-        'sort_by': sort_by,
-        'query_params': query_params,
-    }
-    
-    # Если это HTMX запрос, возвращаем только HTML
-    if request.headers.get('HX-Request'):
-        return render(request, 'shop/partials/product_grid.html', context)
-    
-    return render(request, 'shop/catalog.html', context)
+    spec = CatalogSpec.from_query(request.GET)
+    with instrument('htmx_catalog_filter', spec):
+        context = _catalog_context(request, spec)
+        
+        # Если это HTMX запрос, возвращаем только HTML
+        if request.headers.get('HX-Request'):
+            # Счётчики фасетов обновляются вместе с сеткой (out-of-band)
+            context['facets_oob'] = True
+            return render(request, 'shop/partials/product_grid.html', context)
+        
+        return render(request, 'shop/catalog.html', context)
 
 
 def htmx_product_search(request):
@@ -234,10 +174,12 @@ def htmx_product_search(request):
     if not search_query:
         return render(request, 'shop/partials/search_results.html', {'products': []})
     
-    products = Product.objects.filter(
-        Q(name__icontains=search_query) | 
-        Q(description__icontains=search_query)
-    )[:8]
+    products = Product.objects.cards('category__name').select_related('category')
+    # mode=autocomplete - подсказки по мере ввода (pg_trgm), иначе полнотекстовый поиск
+    if request.GET.get('mode') == 'autocomplete':
+        products = autocomplete_products(products, search_query)
+    else:
+        products = search_products(products, search_query).order_by('-rank', '-created_at')[:8]
     
     context = {
         'products': products,
@@ -247,6 +189,8 @@ def htmx_product_search(request):
     return render(request, 'shop/partials/search_results.html', context)
 
 
+@vary_on_headers('HX-Request')
+@condition(etag_func=product_etag, last_modified_func=product_last_modified)
 def htmx_product_details(request, slug):
     """HTMX представление для детальной информации о товаре"""
     product = get_object_or_404(Product, slug=slug)
@@ -254,11 +198,11 @@ def htmx_product_details(request, slug):
     # Получаем дополнительные изображения
     images = product.images.all().order_by('order')
     
-    # Получаем отзывы
-    reviews = Review.objects.filter(product=product, is_approved=True).order_by('-created_at')
+    # Первая страница отзывов; следующие подгружаются при прокрутке
+    reviews = paginate_reviews(product)
     
-    # Вычисляем средний рейтинг
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+    # Средний рейтинг хранится в самом товаре
+    avg_rating = product.avg_rating
     
     context = {
         'product': product,
@@ -274,35 +218,80 @@ def htmx_product_details(request, slug):
     return render(request, 'shop/product_detail.html', context)
 
 
+def _fragment_product(slug):
+    return get_object_or_404(Product.objects.only('id', 'slug', 'category_id'), slug=slug)
+
+
+def htmx_product_reviews(request, slug):
+    """HTMX фрагмент: страница отзывов (первая или следующая после курсора)"""
+    product = _fragment_product(slug)
+    cursor = request.GET.get('cursor')
+    
+    def get_context():
+        return {'product': product, 'reviews': paginate_reviews(product, cursor)}
+    
+    key = f'{product.pk}:{get_version(reviews_version_key(product.pk))}:{cursor or ""}'
+    return render_fragment(request, 'reviews', key, 'shop/partials/review_page.html', get_context)
+
+
+def htmx_product_rating(request, slug):
+    """HTMX фрагмент: средняя оценка и гистограмма оценок"""
+    product = get_object_or_404(
+        Product.objects.only(
+            'id', 'slug', 'avg_rating', 'review_count',
+            'rating_count_1', 'rating_count_2', 'rating_count_3', 'rating_count_4', 'rating_count_5',
+        ),
+        slug=slug,
+    )
+    
+    key = f'{product.pk}:{get_version(reviews_version_key(product.pk))}'
+    return render_fragment(
+        request, 'rating', key, 'shop/partials/rating_summary.html', lambda: {'product': product}
+    )
+
+
+def htmx_related_products(request, slug):
+    """HTMX фрагмент: похожие товары"""
+    product = _fragment_product(slug)
+    
+    def get_context():
+        # Предрасчитанный список (compute_related_products), иначе - товары той же категории
+        related_products = list(
+            Product.objects.cards().cached()
+            .filter(related_from__product=product)
+            .order_by('related_from__rank')[:RELATED_PRODUCTS_COUNT]
+        )
+        if not related_products:
+            related_products = Product.objects.cards().cached().filter(
+                category_id=product.category_id
+            ).exclude(id=product.id)[:RELATED_PRODUCTS_COUNT]
+        return {'related_products': related_products}
+    
+    key = f'{product.pk}:{get_catalog_version()}'
+    return render_fragment(request, 'related', key, 'shop/partials/related_products.html', get_context)
+
+
 # HTMX представление для добавления в корзину удалено - теперь используется Telegram
 
 
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 def htmx_load_more_products(request):
     """HTMX представление для подгрузки дополнительных товаров"""
-    page = int(request.GET.get('page', 1))
-    category_slug = request.GET.get('category')
-    gender = request.GET.get('gender')
-    
-    products = Product.objects.all()
-    
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug, is_active=True)
-        products = products.filter(category=category)
-    
-    if gender:
-        products = products.filter(gender=gender)
-    
-    # Пагинация
-    paginator = Paginator(products, 12)
-    page_obj = paginator.get_page(page)
-    
-    context = {
-        'products': page_obj,
-        'has_next': page_obj.has_next(),
-        'next_page': page + 1 if page_obj.has_next() else None,
-    }
-    
-    return render(request, 'shop/partials/product_grid.html', context)
+    spec = CatalogSpec.from_query(request.GET)
+    with instrument('htmx_load_more_products', spec):
+        products = spec.queryset(spec.get_category())
+        
+        # Пагинация по курсору: стоимость страницы не зависит от глубины прокрутки
+        products_page = paginate_keyset(products, spec.sort, request.GET.get('cursor'), spec.page_size)
+        
+        context = {
+            'products': products_page,
+            'has_next': products_page.has_next,
+            'next_cursor': products_page.next_cursor,
+            'query_params': spec.query_params,
+        }
+        
+        return render(request, 'shop/partials/product_page.html', context)
 
 
 def htmx_toggle_favorite(request, product_id):
@@ -337,7 +326,7 @@ def favorites_page(request):
         favorites = []
     
     # Получаем товары из базы данных
-    products = Product.objects.filter(
+    products = Product.objects.cards().cached().filter(
         id__in=favorites
     ).order_by('-created_at')
     
@@ -349,45 +338,52 @@ def favorites_page(request):
     return render(request, 'shop/favorites.html', context)
 
 
+def _favorites_data(product_ids):
+    """Данные избранных товаров для JSON-ответа"""
+    # Получаем товары из базы данных
+    products = Product.objects.filter(
+        id__in=product_ids
+    ).select_related('category').cached()
+    
+    # Формируем данные для ответа
+    products_data = []
+    for product in products:
+        products_data.append({
+            'id': product.id,
+            'name': product.name,
+            'slug': product.slug,
+            'price': float(product.price),
+            'old_price': float(product.old_price) if product.old_price else None,
+            'main_image': product.main_image.url if product.main_image else None,
+            'discount_percentage': product.discount_percentage,
+            'category': {
+                'name': product.category.name,
+                'slug': product.category.slug,
+            },
+            'gender': product.gender,
+            'available_sizes': product.available_sizes_list,
+            'available_colors': product.available_colors_list,
+        })
+    
+    return JsonResponse({
+        'success': True,
+        'products': products_data,
+        'count': len(products_data)
+    })
+
+
 @csrf_exempt
+@condition(etag_func=favorites_etag)
 def api_favorites_data(request):
     """API для получения данных избранных товаров"""
+    # GET ?ids=1,2,3 поддерживает ETag: повторный запрос без изменений получает 304
+    if request.method == 'GET':
+        return _favorites_data(favorite_ids(request))
+    
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            product_ids = data.get('product_ids', [])
-            
-            # Получаем товары из базы данных
-            products = Product.objects.filter(
-                id__in=product_ids
-            )
-            
-            # Формируем данные для ответа
-            products_data = []
-            for product in products:
-                products_data.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'slug': product.slug,
-                    'price': float(product.price),
-                    'old_price': float(product.old_price) if product.old_price else None,
-                    'main_image': product.main_image.url if product.main_image else None,
-                    'discount_percentage': product.discount_percentage,
-                    'category': {
-                        'name': product.category.name,
-                        'slug': product.category.slug,
-                    },
-                    'gender': product.gender,
-                    'available_sizes': product.available_sizes_list,
-                    'available_colors': product.available_colors_list,
-                })
-            
-            return JsonResponse({
-                'success': True,
-                'products': products_data,
-                'count': len(products_data)
-            })
-            
+            return _favorites_data(data.get('product_ids', []))
         except (json.JSONDecodeError, TypeError) as e:
             return JsonResponse({
                 'success': False,
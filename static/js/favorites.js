@@ -335,16 +335,7 @@ class FavoritesManager {
         }
 
         try {
-            const response = await fetch('/api/favorites/data/', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': this.getCSRFToken()
-                },
-                body: JSON.stringify({
-                    product_ids: this.favorites
-                })
-            });
+            const response = await fetch('/api/favorites/data/?ids=' + this.favorites.join(','));
 
             if (response.ok) {
                 return await response.json();